@@ -0,0 +1,62 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+"""
+Change permission checks for many timeseries at once.
+
+`user.has_perm` evaluates the lizard_security permission mappers per
+timeseries. Here the timeseries a user may change through the data sets
+of their user groups are found in one query. Only the remaining ones are
+checked with `has_perm`, which also knows the other ways to get the
+permission. Results are cached per user and set of timeseries for
+`DIKEDATA_API_PERMISSION_TIMEOUT` seconds, so frequent posts of the same
+sensors don't repeat the query.
+
+"""
+from __future__ import unicode_literals
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import get_cache
+
+from ddsc_core.auth import PERMISSION_CHANGE
+from ddsc_core.models import Timeseries
+
+CACHE = getattr(settings, 'DIKEDATA_API_PERMISSION_CACHE', 'default')
+TIMEOUT = getattr(settings, 'DIKEDATA_API_PERMISSION_TIMEOUT', 60)
+
+
+def _key(user, ids):
+    digest = hashlib.md5(
+        ','.join(['%s' % pk for pk in sorted(ids)]).encode('utf-8'))
+    return 'dikedata_api.access:%s:%s' % (user.pk, digest.hexdigest())
+
+
+def changeable_ids(user, series):
+    """
+    Return the set of ids of the timeseries in `series` that `user` may
+    change.
+    """
+    ids = set(ts.pk for ts in series)
+    if user.is_superuser:
+        return ids
+    if not ids or not user.is_authenticated():
+        return set()
+
+    cache = get_cache(CACHE)
+    key = _key(user, ids)
+    allowed = cache.get(key)
+    if allowed is not None:
+        return allowed
+
+    codename = PERMISSION_CHANGE.split('.')[-1]
+    allowed = set(Timeseries.objects.filter(
+        id__in=ids,
+        data_set__permission_mappers__permission_group__permissions__codename=
+            codename,
+        data_set__permission_mappers__user_group__members=user,
+    ).values_list('id', flat=True).distinct())
+    for ts in series:
+        if ts.pk not in allowed and user.has_perm(PERMISSION_CHANGE, ts):
+            allowed.add(ts.pk)
+    cache.set(key, allowed, TIMEOUT)
+    return allowed
@@ -0,0 +1,88 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+"""
+Bucketed aggregation of events, computed with vectorized NumPy reductions.
+
+Buckets are aligned on the epoch, so a `1H` interval starts every bucket
+on a whole UTC hour.
+"""
+from __future__ import unicode_literals
+
+import re
+
+import numpy as np
+
+from dikedata_api.utils import DATETIME64_MS
+
+INTERVAL_UNITS = {
+    'S': 1000,
+    'T': 60 * 1000,
+    'MIN': 60 * 1000,
+    'H': 60 * 60 * 1000,
+    'D': 24 * 60 * 60 * 1000,
+    'W': 7 * 24 * 60 * 60 * 1000,
+}
+AGGREGATES = ('min', 'max', 'mean', 'count')
+
+_interval_re = re.compile(r'^\s*(\d*)\s*([a-zA-Z]+)\s*$')
+
+
+def parse_interval(interval):
+    """
+    Return the length of an interval like `15min`, `1H` or `D` in ms.
+    """
+    match = _interval_re.match(interval)
+    if match is None or match.group(2).upper() not in INTERVAL_UNITS:
+        raise ValueError("Invalid interval: %s" % interval)
+    number = int(match.group(1) or 1)
+    if number < 1:
+        raise ValueError("Invalid interval: %s" % interval)
+    return number * INTERVAL_UNITS[match.group(2).upper()]
+
+
+def parse_aggregates(agg):
+    """
+    Return the list of aggregates in a comma separated string.
+    """
+    aggregates = [name.strip() for name in agg.split(',') if name.strip()]
+    for name in aggregates:
+        if name not in AGGREGATES:
+            raise ValueError("Invalid aggregate: %s" % name)
+    return aggregates
+
+
+def aggregate(timestamps, values, interval, aggregates=AGGREGATES):
+    """
+    Return per-bucket statistics of `values`.
+
+    `timestamps` are sorted int64 ms since epoch, `interval` is the bucket
+    length in ms. NaN values are ignored, empty buckets are left out. The
+    result maps `datetime` (bucket start, datetime64[ms]) and each of the
+    requested aggregates to an array with one element per bucket.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    keep = ~np.isnan(values)
+    timestamps = np.asarray(timestamps, dtype=np.int64)[keep]
+    values = values[keep]
+
+    buckets = timestamps // interval
+    if len(buckets):
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    else:
+        starts = np.array([], dtype=np.intp)
+    counts = np.diff(np.r_[starts, len(values)])
+
+    result = {
+        'datetime': (buckets[starts] * interval).astype(DATETIME64_MS),
+    }
+    for name in aggregates:
+        if not len(starts):
+            result[name] = np.array([])
+        elif name == 'min':
+            result[name] = np.minimum.reduceat(values, starts)
+        elif name == 'max':
+            result[name] = np.maximum.reduceat(values, starts)
+        elif name == 'mean':
+            result[name] = np.add.reduceat(values, starts) / counts
+        elif name == 'count':
+            result[name] = counts
+    return result
@@ -0,0 +1,141 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+"""
+Conditional GET support (ETag, Last-Modified and 304 Not Modified) for
+timeseries and their events.
+
+The validators of event lists derive from the latest value timestamp of a
+timeseries and the time of its last change, which is kept in the Django
+cache because writes of older events don't change the latest value
+timestamp. Writes through this API, saves of the timeseries and of the
+location, parameter and unit shown with its events update that time.
+When it is unknown, it is taken to be now. Other changes, like events
+written by other services, can't be seen here, so the time expires after
+`DIKEDATA_API_CONDITIONAL_TIMEOUT` seconds, which bounds how long a
+client can be told its copy is current by mistake.
+
+The ETag of a timeseries itself is a hash of its serialized data.
+
+"""
+from __future__ import unicode_literals
+
+import calendar
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.http import HttpResponseNotModified
+from django.utils.http import (http_date, parse_etags, parse_http_date_safe,
+                               quote_etag)
+from django.db.models.signals import post_save
+from rest_framework.utils.encoders import JSONEncoder
+
+from ddsc_core.models import Location, Timeseries
+from ddsc_core.models.aquo import Parameter, Unit
+from dikedata_api.utils import naive_utc
+
+CACHE = getattr(settings, 'DIKEDATA_API_CONDITIONAL_CACHE', 'default')
+TIMEOUT = getattr(settings, 'DIKEDATA_API_CONDITIONAL_TIMEOUT', 10 * 60)
+
+
+def _key(uuid):
+    return 'dikedata_api.conditional:%s' % uuid
+
+
+def touch(uuid):
+    """
+    Record that the events or metadata of timeseries `uuid` changed now.
+    """
+    get_cache(CACHE).set(_key(uuid), int(time.time()), TIMEOUT)
+
+
+def touch_many(uuids):
+    now = int(time.time())
+    get_cache(CACHE).set_many(
+        dict((_key(uuid), now) for uuid in uuids), TIMEOUT)
+
+
+def last_write(uuid):
+    """
+    Return the time of the last change of timeseries `uuid` in seconds
+    since epoch.
+    """
+    cache = get_cache(CACHE)
+    cache.add(_key(uuid), int(time.time()), TIMEOUT)
+    return cache.get(_key(uuid)) or int(time.time())
+
+
+def get_validators(request, ts):
+    """
+    Return the ETag and Last-Modified (in seconds since epoch) of the
+    response to `request` for timeseries `ts`.
+    """
+    last_modified = last_write(ts.uuid)
+    latest = naive_utc(ts.latest_value_timestamp)
+    if latest is not None:
+        last_modified = max(last_modified, calendar.timegm(latest.timetuple()))
+    etag = hashlib.md5(';'.join([
+        ts.uuid,
+        '%s' % latest,
+        '%s' % last_modified,
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+    ]).encode('utf-8')).hexdigest()
+    return etag, last_modified
+
+
+def get_data_etag(request, data):
+    """
+    Return the ETag of the response to `request` with `data`.
+    """
+    content = json.dumps(data, cls=JSONEncoder, sort_keys=True)
+    return hashlib.md5(';'.join([
+        content,
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+    ]).encode('utf-8')).hexdigest()
+
+
+def is_not_modified(request, etag, last_modified=None):
+    """
+    Return True if the client already has the response with these validators.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return (if_modified_since is not None and last_modified is not None and
+            last_modified <= if_modified_since)
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def not_modified_response(etag, last_modified=None):
+    return set_validators(HttpResponseNotModified(), etag, last_modified)
+
+
+def _timeseries_saved(sender, instance, **kwargs):
+    touch(instance.uuid)
+
+
+def _related_saved(sender, instance, **kwargs):
+    # Their names are part of flot responses of all their timeseries.
+    field = sender._meta.object_name.lower()
+    touch_many(Timeseries.objects.filter(**{field: instance})
+               .values_list('uuid', flat=True))
+
+
+post_save.connect(_timeseries_saved, sender=Timeseries,
+                  dispatch_uid='dikedata_api.conditional.timeseries_saved')
+for model in (Location, Parameter, Unit):
+    post_save.connect(_related_saved, sender=model,
+                      dispatch_uid='dikedata_api.conditional.%s_saved' %
+                      model._meta.object_name.lower())
@@ -13,6 +13,8 @@
 #
 # Changed by ejnens: added decimate_until, fixed decimate recusion causing a stack
 # overflow, properly use numpy bool arrays
+# Changed: added significance, decimate_until and decimate_top select on it,
+# implemented decimate_2d
 #------------------------------------------------------------------------------
 
 import numpy as np
@@ -22,25 +24,68 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def decimate_until(x, y, tolerance, max_values=1200, max_steps=35, step_factor=8.0):
+def decimate_until(x, y, tolerance, max_values=1200, max_steps=35, step_factor=8.0,
+                   sig=None):
+    """ Returns decimated x and y arrays with at most max_values points.
+
+    The tolerance is multiplied by step_factor until the result fits. Instead
+    of running decimate for every step, this selects on the significance of
+    each point, which is computed once (or passed in as sig).
+    """
     if len(x) <= max_values:
         # nothing to do
         return x, y
+    if sig is None:
+        sig = significance(x, y, tolerance)
+    sorted_sig = np.sort(sig)
     for step in range(max_steps):
         logger.debug('decimate_until: step %s', step)
-        # operate on a copy, so the errors don't accumulate
-        x2 = x.copy()
-        y2 = y.copy()
-        x2, y2 = decimate(x2, y2, tolerance)
-        if len(x2) > max_values:
+        used = tolerance
+        kept = len(sig) - np.searchsorted(sorted_sig, used, side='right')
+        if kept > max_values:
             tolerance *= step_factor
         else:
             break
-    return x2, y2
+    keep = sig > used
+    return x[keep], y[keep]
+
+def decimate_top(x, y, max_values, sig=None):
+    """ Returns the max_values most significant points of x and y.
+
+    Douglas-Peucker never keeps a point without keeping the point that split
+    its segment, so this is the result of decimate for the smallest tolerance
+    that leaves at most max_values points (ties aside).
+    """
+    if len(x) <= max_values:
+        return x, y
+    if sig is None:
+        sig = significance(x, y)
+    keep = zeros(len(x), dtype=np.bool)
+    keep[np.argsort(sig)[len(x) - max_values:]] = True
+    return x[keep], y[keep]
 
-def decimate_2d(x, y, tolerance_w, tolerance_h):
-    # TODO implement me
-    raise NotImplementedError
+def decimate_2d(x, y, tolerance_w, tolerance_h, max_values=None):
+    """ Returns decimated x and y arrays, with a separate tolerance per axis.
+
+    Both axes are normalized by their tolerance, which is usually the size of
+    a pixel in units of x and y, so the simplification happens in pixels.
+    Optionally, at most max_values of the most significant points are kept.
+
+    """
+    if len(x) < 3:
+        return x, y
+    sig = significance(_normalize(x, tolerance_w), _normalize(y, tolerance_h),
+                       1.0)
+    if max_values is not None and np.count_nonzero(sig > 1.0) > max_values:
+        return decimate_top(x, y, max_values, sig=sig)
+    keep = sig > 1.0
+    return x[keep], y[keep]
+
+def _normalize(a, tolerance):
+    # A zero tolerance means the axis has no range, so it doesn't matter.
+    if tolerance > 0:
+        return (a - a[0]) / float(tolerance)
+    return zeros(len(a))
 
 def decimate(x, y, tolerance):
     """ Returns decimated x and y arrays.
@@ -92,6 +137,52 @@ def decimate(x, y, tolerance):
 
     return x[keep], y[keep]
 
+def significance(x, y, min_tolerance=0.0):
+    """ Returns the tolerance at which each point is dropped by decimate.
+
+    This runs Douglas and Peucker's algorithm once, down to min_tolerance.
+    The significance of a point is its distance to the segment it splits,
+    capped by the significance of the point that split the parent segment.
+    decimate(x, y, tolerance) keeps exactly the points with a significance
+    larger than tolerance, for any tolerance >= min_tolerance, so these
+    become a cheap selection on the result, which can also be cached.
+
+    """
+    sig = zeros(len(x))
+    if len(x) == 0:
+        return sig
+    sig[0] = np.inf
+    sig[-1] = np.inf
+    segments = deque([(0, len(x) - 1, np.inf)])
+    while segments:
+        si, ei, limit = segments.pop()
+
+        # check if the two data points are adjacent
+        if ei < (si + 2):
+            continue
+
+        # now find the perpendicular distance to each point
+        x0 = x[si+1:ei]
+        y0 = y[si+1:ei]
+
+        xei_minux_xsi = x[ei] - x[si]
+        yei_minux_ysi = y[ei] - y[si]
+
+        top = absolute(xei_minux_xsi * (y[si] - y0) - (x[si] - x0) * yei_minux_ysi)
+        bot = sqrt(xei_minux_xsi*xei_minux_xsi + yei_minux_ysi*yei_minux_ysi)
+        dist = top / bot
+
+        # the point that is furthest from line between points si and ei
+        index = argmax(dist)
+        abs_index = index + (si + 1)
+        if dist[index] <= min_tolerance:
+            continue
+        sig[abs_index] = min(dist[index], limit)
+        segments.append((si, abs_index, sig[abs_index]))
+        segments.append((abs_index, ei, sig[abs_index]))
+
+    return sig
+
 if __name__ == "__main__":
     from numpy.random import random
 
@@ -0,0 +1,87 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+"""
+Linear time line downsamplers, as an alternative to Douglas-Peucker.
+
+Both expect sorted `x` and NaN free `y` arrays and return the selected
+points as new arrays:
+
+- M4 keeps the first, last, minimum and maximum point of every pixel
+  column, so the rendered line is identical at the given width.
+- Largest-Triangle-Three-Buckets keeps exactly `threshold` points that
+  preserve the visual shape of the line.
+
+"""
+from __future__ import unicode_literals
+
+import numpy as np
+
+DOWNSAMPLERS = ('rdp', 'm4', 'lttb')
+
+
+def m4(x, y, width, xmin=None, xmax=None):
+    """
+    Return at most 4 points per pixel column, for a graph `width` pixels
+    wide that spans `xmin` to `xmax` (the range of `x` by default).
+    """
+    n = len(x)
+    width = int(width)
+    if n <= 4 * width or width < 1:
+        return x, y
+    xmin = x[0] if xmin is None else xmin
+    xmax = x[-1] if xmax is None else xmax
+    if xmax <= xmin:
+        return x[[0, -1]], y[[0, -1]]
+
+    columns = ((x - xmin) * (width / float(xmax - xmin))).astype(np.int64)
+    columns = np.clip(columns, 0, width - 1)
+    starts = np.flatnonzero(np.r_[True, columns[1:] != columns[:-1]])
+    ends = np.r_[starts[1:], n]
+    counts = ends - starts
+    group = np.repeat(np.arange(len(starts)), counts)
+
+    def first_per_group(mask):
+        positions = np.flatnonzero(mask)
+        groups = group[positions]
+        return positions[np.r_[True, groups[1:] != groups[:-1]]]
+
+    mins = np.repeat(np.minimum.reduceat(y, starts), counts)
+    maxs = np.repeat(np.maximum.reduceat(y, starts), counts)
+    keep = np.zeros(n, dtype=bool)
+    keep[starts] = True
+    keep[ends - 1] = True
+    keep[first_per_group(y == mins)] = True
+    keep[first_per_group(y == maxs)] = True
+    return x[keep], y[keep]
+
+
+def lttb(x, y, threshold):
+    """
+    Return exactly `threshold` points using Largest-Triangle-Three-Buckets.
+    """
+    n = len(x)
+    threshold = int(threshold)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # Bucket edges for the points between the first and the last one.
+    every = (n - 2) / float(threshold - 2)
+    edges = np.r_[(np.arange(threshold - 2) * every).astype(np.int64) + 1,
+                  n - 1]
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+
+    selected = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        # Twice the area of the triangles formed by the previously selected
+        # point, each candidate in this bucket and the next bucket average.
+        area = np.absolute(
+            (x[selected] - avg_x) * (y[lo:hi] - y[selected]) -
+            (x[selected] - x[lo:hi]) * (avg_y - y[selected]))
+        selected = lo + int(np.argmax(area))
+        keep[i + 1] = selected
+    return x[keep], y[keep]
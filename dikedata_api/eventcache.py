@@ -0,0 +1,68 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+"""
+Cache of event list responses, invalidated by writes.
+
+Responses are stored in the Django cache backend configured by
+`DIKEDATA_API_EVENTS_CACHE`. Every timeseries has a generation in the
+cache, which writes replace by a new random one. The key of a response
+holds the generations of the timeseries it shows, read before the event
+store is. So after a write, responses stored before it, or from a read
+that raced with it, are no longer found. Responses expire after
+`DIKEDATA_API_EVENTS_CACHE_TIMEOUT` seconds.
+
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import random
+
+from django.conf import settings
+from django.core.cache import get_cache
+
+CACHE = getattr(settings, 'DIKEDATA_API_EVENTS_CACHE', 'default')
+TIMEOUT = getattr(settings, 'DIKEDATA_API_EVENTS_CACHE_TIMEOUT', 10 * 60)
+
+
+def _generation_key(uuid):
+    return 'dikedata_api.events:%s:generation' % uuid
+
+
+def get_key(uuids, request):
+    """
+    Return the cache key of the response to `request`, which shows the
+    events of timeseries `uuids`. Get it before reading those events.
+    """
+    keys = [_generation_key(uuid) for uuid in uuids]
+    generations = get_cache(CACHE).get_many(keys)
+    url = ';'.join([request.build_absolute_uri()] +
+                   ['%s' % generations.get(key, 0) for key in keys])
+    digest = hashlib.md5(url.encode('utf-8')).hexdigest()
+    return 'dikedata_api.events:%s:%s' % (uuids[0], digest)
+
+
+def get(key):
+    return get_cache(CACHE).get(key)
+
+
+def store(key, data):
+    get_cache(CACHE).set(key, data, TIMEOUT)
+
+
+def invalidate(uuid):
+    """
+    Make the cached responses of timeseries `uuid` unreachable.
+    """
+    invalidate_many([uuid])
+
+
+def invalidate_many(uuids):
+    """
+    Make the cached responses of timeseries `uuids` unreachable, in one
+    cache call.
+    """
+    generations = dict((_generation_key(uuid), '%x' % random.getrandbits(64))
+                       for uuid in uuids)
+    if generations:
+        # As long as the responses, so a response can't outlive its
+        # generation.
+        get_cache(CACHE).set_many(generations, TIMEOUT)
@@ -0,0 +1,104 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+"""
+Window metadata of timeseries, to avoid event store reads of empty windows.
+
+Whether a window holds events at all follows from the first and latest
+value timestamps kept on the timeseries. Besides that, the number of
+events written per UTC day is kept in the Django cache, so the read that
+replaces an empty window by the latest events can be limited to about
+`DIKEDATA_API_FALLBACK_EVENTS` events. The day counts only hold writes
+since they were first cached. Days without counts are assumed to be empty,
+which can make that read longer than needed. Events that are written again
+are counted again, which can make it shorter.
+
+"""
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.cache import get_cache
+import numpy as np
+
+from dikedata_api.utils import epoch_ms, from_ms, naive_utc, to_ms
+
+CACHE = getattr(settings, 'DIKEDATA_API_EVENTINDEX_CACHE', 'default')
+TIMEOUT = getattr(settings, 'DIKEDATA_API_EVENTINDEX_TIMEOUT', 30 * 24 * 60 * 60)
+FALLBACK_EVENTS = getattr(settings, 'DIKEDATA_API_FALLBACK_EVENTS', 100000)
+MAX_DAYS = 3660
+DAY = 24 * 60 * 60 * 1000
+
+
+def _key(uuid):
+    return 'dikedata_api.eventindex:%s' % uuid
+
+
+def record(uuid, index):
+    """
+    Add the timestamps of written events to the day counts of `uuid`.
+    """
+    record_many([(uuid, index)])
+
+
+def record_many(indexes):
+    """
+    Add the timestamps of the `(uuid, index)` pairs of written events to
+    the day counts, with one cache read and one cache write.
+    """
+    indexes = [(uuid, index) for uuid, index in indexes if len(index)]
+    if not indexes:
+        return
+    cache = get_cache(CACHE)
+    keys = set(_key(uuid) for uuid, index in indexes)
+    found = cache.get_many(list(keys))
+    changed = {}
+    for uuid, index in indexes:
+        days = np.sort(epoch_ms(index) // DAY)
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        counts = np.diff(np.r_[starts, len(days)])
+        day_counts = changed.setdefault(_key(uuid),
+                                        found.get(_key(uuid)) or {})
+        for day, count in zip(days[starts].tolist(), counts.tolist()):
+            day_counts[day] = day_counts.get(day, 0) + count
+    for day_counts in changed.values():
+        if len(day_counts) > MAX_DAYS:
+            for day in sorted(day_counts)[:len(day_counts) - MAX_DAYS]:
+                del day_counts[day]
+    cache.set_many(changed, TIMEOUT)
+
+
+def window_is_empty(ts, start, end):
+    """
+    Return True if `ts` has no events between `start` and `end` for sure.
+    """
+    first = naive_utc(ts.first_value_timestamp)
+    latest = naive_utc(ts.latest_value_timestamp)
+    if latest is None:
+        return True
+    if start is not None and start > latest:
+        return True
+    if end is not None and first is not None and end < first:
+        return True
+    return False
+
+
+def fallback_window(ts, start, end):
+    """
+    Return the window of the latest events of `ts` to show instead of the
+    empty window from `start` to `end`: a window of the same length that
+    ends at the latest value, shortened to about FALLBACK_EVENTS events.
+    """
+    latest = naive_utc(ts.latest_value_timestamp)
+    if latest is None:
+        return start, end
+    fallback_start = latest - (end - start)
+
+    day_counts = get_cache(CACHE).get(_key(ts.uuid)) or {}
+    first_day = to_ms(fallback_start) // DAY
+    total = 0
+    for day in sorted(day_counts, reverse=True):
+        if day < first_day:
+            break
+        total += day_counts[day]
+        if total > FALLBACK_EVENTS:
+            fallback_start = max(fallback_start, from_ms(day * DAY))
+            break
+    return fallback_start, latest
@@ -6,10 +6,11 @@ import math
 from django.conf import settings
 from django.contrib.gis.geos import Point
 from rest_framework import fields, serializers
-from rest_framework.reverse import reverse
 
 from ddsc_core.utils import transform
 
+from dikedata_api.utils import event_detail_url_format
+
 COLNAME_FORMAT_MS = '%Y-%m-%dT%H:%M:%S.%fZ'  # supports milliseconds
 
 
@@ -77,9 +78,8 @@ class LatestValue(serializers.HyperlinkedIdentityField):
         if obj.is_file():
             latest_value = obj.latest_value_file()
             if latest_value:
-                return reverse(
-                    'event-detail', args=[obj.uuid, latest_value],
-                    request=self.context['request'])
+                url_format = event_detail_url_format(self.context['request'])
+                return url_format.format(uuid=obj.uuid, dt=latest_value)
             return None
 
         # Not a number, float("NaN"), is serialized to NaN (without quotes),
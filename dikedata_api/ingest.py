@@ -0,0 +1,187 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+"""
+Queue of event batches that are written asynchronously.
+
+Batches posted with `?async=1` are spooled to disk and written by the
+`ingest_worker` management command. The spool directory, set with
+`DIKEDATA_API_INGEST_SPOOL` (BUILDOUT_DIR/var/ingest by default), holds:
+
+- `queue/<id>.pickle`: batches waiting to be written,
+- `work/<id>.pickle`: batches claimed by a worker,
+- `jobs/<id>.json`: the status of every job.
+
+Files are moved between these directories with atomic renames, so any
+number of worker processes can drain the queue. Batches of workers that
+died stay in `work/`; `ingest_worker --requeue` moves them back.
+
+"""
+from __future__ import unicode_literals
+
+from datetime import datetime
+import cPickle as pickle
+import json
+import logging
+import os
+import re
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+logger = logging.getLogger(__name__)
+
+SPOOL = getattr(settings, 'DIKEDATA_API_INGEST_SPOOL', os.path.join(
+    getattr(settings, 'BUILDOUT_DIR', tempfile.gettempdir()), 'var', 'ingest'))
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _path(kind, job_id, extension):
+    return os.path.join(SPOOL, kind, '%s.%s' % (job_id, extension))
+
+
+def _makedirs():
+    for kind in ('tmp', 'queue', 'work', 'jobs'):
+        path = os.path.join(SPOOL, kind)
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # created by another process in the meantime
+                if not os.path.isdir(path):
+                    raise
+
+
+def _write(path, content):
+    """
+    Replace the file at `path` atomically.
+    """
+    handle, tmp = tempfile.mkstemp(dir=os.path.join(SPOOL, 'tmp'))
+    with os.fdopen(handle, 'wb') as f:
+        f.write(content)
+    os.rename(tmp, path)
+
+
+def _now():
+    return datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _save_job(job):
+    _write(_path('jobs', job['id'], 'json'), json.dumps(job))
+
+
+def get_job(job_id):
+    """
+    Return the status of job `job_id` as a dict, or None if it is unknown.
+    """
+    if not JOB_ID.match(job_id or ''):
+        return None
+    try:
+        with open(_path('jobs', job_id, 'json'), 'rb') as f:
+            return json.load(f)
+    except IOError:
+        return None
+
+
+def enqueue(user, data, series, events):
+    """
+    Spool `data`, as accepted by `write_events`, to be written for `user`.
+
+    `series` and `events` are the number of timeseries and events in the
+    batch. Returns the status of the new job.
+    """
+    _makedirs()
+    job = {
+        'id': uuid.uuid4().hex,
+        'user_id': user.pk,
+        'status': 'queued',
+        'created': _now(),
+        'started': None,
+        'finished': None,
+        'series': series,
+        'events': events,
+        'written': None,
+        'timeseries': None,
+        'locations': None,
+        'errors': [],
+    }
+    _save_job(job)
+    _write(_path('queue', job['id'], 'pickle'),
+           pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+    return job
+
+
+def claim():
+    """
+    Move the oldest queued batch to `work/` and return its job id, or None
+    if the queue is empty.
+    """
+    _makedirs()
+    queue = os.path.join(SPOOL, 'queue')
+    queued = []
+    for name in os.listdir(queue):
+        if not name.endswith('.pickle'):
+            continue
+        path = os.path.join(queue, name)
+        try:
+            queued.append((os.stat(path).st_mtime, path))
+        except OSError:
+            # claimed by another worker
+            continue
+    for mtime, path in sorted(queued):
+        job_id = os.path.basename(path)[:-len('.pickle')]
+        try:
+            os.rename(path, _path('work', job_id, 'pickle'))
+        except OSError:
+            # claimed by another worker
+            continue
+        return job_id
+    return None
+
+
+def requeue():
+    """
+    Move all claimed batches back to the queue. Returns their number.
+    """
+    _makedirs()
+    work = os.path.join(SPOOL, 'work')
+    count = 0
+    for name in os.listdir(work):
+        if name.endswith('.pickle'):
+            os.rename(os.path.join(work, name),
+                      os.path.join(SPOOL, 'queue', name))
+            count += 1
+    return count
+
+
+def run(job_id):
+    """
+    Write the claimed batch of job `job_id` and record the outcome.
+    """
+    from dikedata_api.views import write_events
+
+    path = _path('work', job_id, 'pickle')
+    job = get_job(job_id)
+    if job is None:
+        logger.error('Ingest job %s has no status, skipping it', job_id)
+        os.remove(path)
+        return None
+    job.update(status='running', started=_now())
+    _save_job(job)
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        user = User.objects.get(pk=job['user_id'])
+        written, timeseries, locations, errors = write_events(user, data)
+    except Exception as e:
+        logger.exception('Ingest job %s failed', job_id)
+        job.update(status='failed', errors=['%s' % e])
+    else:
+        job.update(status='done', written=written, timeseries=timeseries,
+                   locations=locations,
+                   errors=['%s: %s' % (key, error)
+                           for key, error in sorted(errors.items())])
+    job['finished'] = _now()
+    _save_job(job)
+    os.remove(path)
+    return job
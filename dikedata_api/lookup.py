@@ -0,0 +1,130 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+"""
+Resolution of the uuids and remote ids of posted events to timeseries.
+
+All keys of a batch are resolved with at most one query per kind of key.
+The timeseries ids found are kept in a process level LRU cache, so the
+next batch of the same sensors needs a single query by primary key. Deletes
+of timeseries and saves and deletes of id mappings remove their entries
+through signals; as those only reach this process, entries also expire
+after `DIKEDATA_API_LOOKUP_TIMEOUT` seconds.
+
+"""
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+
+from ddsc_core.models import IdMapping, Timeseries
+
+SIZE = getattr(settings, 'DIKEDATA_API_LOOKUP_SIZE', 10000)
+TIMEOUT = getattr(settings, 'DIKEDATA_API_LOOKUP_TIMEOUT', 5 * 60)
+
+
+class LRUCache(object):
+    """
+    Thread safe mapping of at most `size` entries that expire after
+    `timeout` seconds, dropping the least recently used entries first.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[1] < time.time():
+                return None
+            self._entries[key] = entry
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + self.timeout)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_ids = LRUCache(SIZE, TIMEOUT)
+
+
+def _uuid_key(uuid):
+    return ('uuid', uuid)
+
+
+def _remote_key(user_id, remote_id):
+    return ('remote_id', user_id, remote_id)
+
+
+def resolve(user, keys):
+    """
+    Return a dict of the timeseries of `keys`, which are timeseries uuids
+    or remote ids of `user`, like `write_events` accepts them.
+
+    Raises Timeseries.DoesNotExist for keys that are neither.
+    """
+    keys = set(keys)
+    ids = {}
+    for key in keys:
+        pk = _ids.get(_uuid_key(key)) or _ids.get(_remote_key(user.pk, key))
+        if pk is not None:
+            ids[key] = pk
+
+    series = {}
+    if ids:
+        found = Timeseries.objects.in_bulk(set(ids.values()))
+        for key, pk in ids.items():
+            if pk in found:
+                series[key] = found[pk]
+
+    unknown = keys - set(series)
+    if unknown:
+        for ts in Timeseries.objects.filter(uuid__in=unknown):
+            series[ts.uuid] = ts
+            _ids.set(_uuid_key(ts.uuid), ts.pk)
+        unknown -= set(series)
+    if unknown:
+        mappings = IdMapping.objects.filter(
+            user=user, remote_id__in=unknown).select_related('timeseries')
+        for mapping in mappings:
+            series[mapping.remote_id] = mapping.timeseries
+            _ids.set(_remote_key(user.pk, mapping.remote_id),
+                     mapping.timeseries_id)
+        unknown -= set(series)
+    if unknown:
+        raise Timeseries.DoesNotExist(
+            "Timeseries not found: %s" % ', '.join(sorted(unknown)))
+    return series
+
+
+def _timeseries_deleted(sender, instance, **kwargs):
+    _ids.delete(_uuid_key(instance.uuid))
+
+
+def _mapping_changed(sender, instance, **kwargs):
+    _ids.delete(_remote_key(instance.user_id, instance.remote_id))
+
+
+# Timeseries are saved on every write, which doesn't change their uuid.
+post_delete.connect(_timeseries_deleted, sender=Timeseries,
+                    dispatch_uid='dikedata_api.lookup.timeseries_deleted')
+post_save.connect(_mapping_changed, sender=IdMapping,
+                  dispatch_uid='dikedata_api.lookup.mapping_saved')
+post_delete.connect(_mapping_changed, sender=IdMapping,
+                    dispatch_uid='dikedata_api.lookup.mapping_deleted')
@@ -0,0 +1,66 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+from __future__ import unicode_literals
+
+from multiprocessing import Process
+from optparse import make_option
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from dikedata_api import ingest
+
+logger = logging.getLogger(__name__)
+
+PROCESSES = getattr(settings, 'DIKEDATA_API_INGEST_WORKERS', 4)
+
+
+def work(once, poll):
+    while True:
+        try:
+            job_id = ingest.claim()
+            if job_id is not None:
+                ingest.run(job_id)
+        except Exception:
+            # Keep this worker alive. A batch it claimed stays in work/,
+            # see --requeue.
+            logger.exception("Ingest worker error")
+            time.sleep(poll)
+            continue
+        if job_id is None:
+            if once:
+                return
+            time.sleep(poll)
+
+
+class Command(BaseCommand):
+    help = "Write the event batches that were posted with ?async=1."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int', default=PROCESSES,
+                    help="Number of worker processes."),
+        make_option('--poll', type='float', default=1.0,
+                    help="Seconds to wait when the queue is empty."),
+        make_option('--once', action='store_true', default=False,
+                    help="Exit when the queue is empty."),
+        make_option('--requeue', action='store_true', default=False,
+                    help="First queue the batches of workers that died."),
+    )
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            self.stdout.write("Requeued %d batches.\n" % ingest.requeue())
+        # Don't share the database connection with the workers.
+        connection.close()
+        workers = [Process(target=work, args=(options['once'], options['poll']))
+                   for i in range(options['processes'])]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
@@ -0,0 +1,93 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+"""
+Saving the event metadata of many timeseries at once.
+
+`Timeseries.set_events` updates the first and latest value fields of the
+instance. Instead of a `save()` per timeseries, which writes every column,
+`save_events_metadata` writes only those fields of all timeseries of a
+batch in a single transaction: one `UPDATE ... FROM (VALUES ...)`
+statement on PostgreSQL, one `UPDATE` per timeseries elsewhere. Like
+`QuerySet.update`, this doesn't send `pre_save` and `post_save` signals.
+
+"""
+from __future__ import unicode_literals
+
+from django.db import connection, transaction
+from django.db.models import AutoField, IntegerField
+
+from ddsc_core.models import Timeseries
+
+METADATA_FIELDS = (
+    'first_value_timestamp',
+    'latest_value_timestamp',
+    'latest_value_number',
+    'latest_value_text',
+)
+
+
+def _fields():
+    names = Timeseries._meta.get_all_field_names()
+    return [Timeseries._meta.get_field(name) for name in METADATA_FIELDS
+            if name in names]
+
+
+def _merge(instances):
+    """
+    Return the metadata of instances of the same timeseries, which were
+    written through different keys, as one dict.
+    """
+    latest = [ts for ts in instances
+              if ts.latest_value_timestamp is not None]
+    newest = max(latest, key=lambda ts: ts.latest_value_timestamp) \
+        if latest else instances[-1]
+    values = dict((field.attname, getattr(newest, field.attname))
+                  for field in _fields())
+    firsts = [ts.first_value_timestamp for ts in instances
+              if ts.first_value_timestamp is not None]
+    if 'first_value_timestamp' in values and firsts:
+        values['first_value_timestamp'] = min(firsts)
+    return values
+
+
+def save_events_metadata(series):
+    """
+    Write the first and latest value fields of the `series` instances.
+    """
+    fields = _fields()
+    instances = {}
+    for ts in series:
+        instances.setdefault(ts.pk, []).append(ts)
+    if not instances or not fields:
+        return
+    rows = [(pk, _merge(group)) for pk, group in instances.items()]
+
+    with transaction.commit_on_success():
+        if connection.vendor != 'postgresql':
+            for pk, values in rows:
+                Timeseries.objects.filter(pk=pk).update(**values)
+            return
+
+        qn = connection.ops.quote_name
+        pk_field = Timeseries._meta.pk
+        # Like foreign keys, cast to integer instead of serial.
+        pk_type = (IntegerField() if isinstance(pk_field, AutoField)
+                   else pk_field).db_type(connection=connection)
+        placeholders = '(%s)' % ', '.join(
+            ['%%s::%s' % pk_type] +
+            ['%%s::%s' % field.db_type(connection=connection)
+             for field in fields])
+        params = []
+        for pk, values in rows:
+            params.append(pk_field.get_db_prep_value(pk, connection))
+            for field in fields:
+                params.append(field.get_db_prep_value(
+                    values[field.attname], connection))
+        sql = 'UPDATE %s SET %s FROM (VALUES %s) AS v (%s) WHERE %s.%s = v.%s' % (
+            qn(Timeseries._meta.db_table),
+            ', '.join(['%s = v.%s' % (qn(field.column), qn(field.column))
+                       for field in fields]),
+            ', '.join([placeholders] * len(rows)),
+            ', '.join([qn(field.column) for field in [pk_field] + fields]),
+            qn(Timeseries._meta.db_table), qn(pk_field.column),
+            qn(pk_field.column))
+        connection.cursor().execute(sql, params)
@@ -0,0 +1,161 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+"""
+Timing of the stages of a request, like the permission query, event store
+read, decimation and rendering.
+
+Views time their stages with `timer(request, stage)`. When the response is
+finalized (see `mixins.BaseMixin`), the timings are sent to the client in a
+`Server-Timing` header and added to the in-process histograms, which can
+be inspected at /v1/metrics/ by superusers. The histograms are per process
+and are lost on restart.
+
+"""
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+SERVER_TIMING = getattr(settings, 'DIKEDATA_API_SERVER_TIMING', True)
+
+# Upper bounds of the histogram buckets in ms.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000,
+           30000, 60000)
+
+_lock = threading.Lock()
+_histograms = {}
+
+
+class Histogram(object):
+    """
+    Counts of durations in ms per bucket of `BUCKETS`, with an overflow
+    bucket for longer durations.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, fraction):
+        """
+        Return the upper bound of the bucket holding the `fraction`
+        percentile, or the maximum for the overflow bucket.
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': OrderedDict(
+                [('%s' % bound, count) for bound, count
+                 in zip(BUCKETS + ('inf',), self.counts)]),
+        }
+
+
+def observe(name, ms):
+    """
+    Add a duration of `ms` milliseconds to the histogram of `name`.
+    """
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram()
+        _histograms[name].observe(ms)
+
+
+def snapshot():
+    """
+    Return the histograms of all names as dicts.
+    """
+    with _lock:
+        return OrderedDict([(name, _histograms[name].as_dict())
+                            for name in sorted(_histograms)])
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def add(request, stage, ms):
+    """
+    Add `ms` milliseconds to the time spent in `stage` for `request`.
+
+    Stages can be timed more than once per request, even concurrently by
+    threads that read several timeseries; their durations are summed.
+    """
+    stage = getattr(request, '_stage_prefix', '') + stage
+    with _lock:
+        timings = getattr(request, '_stage_timings', None)
+        if timings is None:
+            timings = OrderedDict()
+            request._stage_timings = timings
+        timings[stage] = timings.get(stage, 0.0) + ms
+
+
+@contextmanager
+def timer(request, stage):
+    """
+    Time the enclosed block as `stage` of `request`.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        add(request, stage, (time.time() - start) * 1000)
+
+
+@contextmanager
+def threads(request, stage):
+    """
+    Time the enclosed block as `stage` of `request`, like `timer`. Stages
+    timed inside it, by the threads it runs, are summed as `stage.<name>`,
+    apart from the stages that are timed as wall-clock time.
+    """
+    start = time.time()
+    request._stage_prefix = '%s.' % stage
+    try:
+        yield
+    finally:
+        request._stage_prefix = ''
+        add(request, stage, (time.time() - start) * 1000)
+
+
+def finish(request, response, view_name):
+    """
+    Record the stage timings of `request` in the histograms of `view_name`
+    and add them to `response` as a Server-Timing header.
+    """
+    timings = getattr(request, '_stage_timings', None)
+    if not timings:
+        return response
+    for stage, ms in timings.items():
+        observe('%s.%s' % (view_name, stage), ms)
+    if SERVER_TIMING:
+        response['Server-Timing'] = ', '.join(
+            ['%s;dur=%.1f' % (stage, ms) for stage, ms in timings.items()])
+    return response
@@ -5,7 +5,9 @@ from django.contrib.auth.decorators import permission_required, login_required,
 from django.utils.decorators import method_decorator
 from rest_framework import generics, mixins
 from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
 
+from dikedata_api import metrics
 from dikedata_api.exceptions import APIException
 
 
@@ -19,6 +21,17 @@ class BaseMixin(object):
         wrapped = APIException(exc)
         return super(BaseMixin, self).handle_exception(wrapped)
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(BaseMixin, self).finalize_response(
+            request, response, *args, **kwargs)
+        if getattr(request, '_stage_timings', None) is None:
+            return response
+        if isinstance(response, Response):
+            # Render now, to include the time it takes in the timings.
+            with metrics.timer(request, 'render'):
+                response.render()
+        return metrics.finish(request, response, self.__class__.__name__)
+
 
 class GetListModelMixin(mixins.ListModelMixin):
     def get(self, request, *args, **kwargs):
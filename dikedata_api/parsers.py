@@ -1,7 +1,14 @@
 # (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
 from __future__ import unicode_literals
 
+from collections import OrderedDict
+import struct
+
+from pandas.parser import CParserError
+from rest_framework.exceptions import ParseError
 from rest_framework.parsers import BaseParser, DataAndFiles
+import numpy as np
+import pandas as pd
 
 
 class SimpleFileUploadParser(BaseParser):
@@ -16,17 +23,134 @@ class SimpleFileUploadParser(BaseParser):
         return DataAndFiles({}, content)
 
 
+class SeriesBlocks(list):
+    """
+    Parsed events as a list of `(uuid, DataFrame)` pairs, one per series,
+    which `write_events` accepts instead of a list of event dicts.
+    """
+
+
 class CSVParser(BaseParser):
+    """
+    Parser of `datetime,uuid,value` rows into a block of events per series.
+    Rows missing a field are refused.
+
+    The stream is read in chunks of `chunk_size` rows, which are parsed and
+    grouped by uuid with pandas, so no object is created per row.
+    """
 
     media_type = 'text/csv'
+    chunk_size = 100000
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        times = OrderedDict()
+        values = {}
+        try:
+            chunks = pd.read_csv(
+                stream, header=None, names=['datetime', 'uuid', 'value'],
+                dtype={'datetime': object, 'uuid': object},
+                skipinitialspace=True, chunksize=self.chunk_size)
+            for chunk in chunks:
+                self.add_chunk(chunk, times, values)
+        except (ValueError, TypeError, CParserError) as e:
+            raise ParseError('CSV parse error - %s' % e)
+
+        data = SeriesBlocks()
+        for uuid in times:
+            index = pd.DatetimeIndex(np.concatenate(times[uuid]))
+            data.append((uuid, pd.DataFrame(
+                {'value': np.concatenate(values[uuid])}, index=index)))
+        return DataAndFiles(data, None)
+
+    @staticmethod
+    def add_chunk(chunk, times, values):
+        """
+        Add the timestamps and values of the rows in `chunk` to the arrays
+        per uuid in `times` and `values`.
+        """
+        if not len(chunk):
+            # empty upload or blank lines only
+            return
+        missing = pd.isnull(chunk).values
+        if missing.any():
+            # Rows are numbered on from chunk to chunk, blank lines skipped.
+            row, column = np.argwhere(missing)[0]
+            raise ParseError('CSV parse error - missing %s in row %d' % (
+                chunk.columns[column], chunk.index[row] + 1))
+        # Timestamps as naive UTC, like the event store returns them.
+        stamps = np.asarray(pd.to_datetime(chunk['datetime'].values,
+                                           utc=True).values)
+        uuids = np.asarray(chunk['uuid'].values)
+        column = np.asarray(chunk['value'].values)
+        order = np.argsort(uuids, kind='mergesort')
+        uuids = uuids[order]
+        starts = np.flatnonzero(np.r_[True, uuids[1:] != uuids[:-1]])
+        ends = np.r_[starts[1:], len(uuids)]
+        for start, end in zip(starts, ends):
+            uuid = uuids[start]
+            rows = order[start:end]
+            times.setdefault(uuid, []).append(stamps[rows])
+            values.setdefault(uuid, []).append(column[rows])
+
+
+class BinaryEventsParser(BaseParser):
+    """
+    Parser of events in a compact binary layout into a block per series.
+
+    All numbers are little-endian. The payload starts with the 4 bytes
+    `DDSC` and a uint8 version, which is 1. Then, per series:
+
+    - the length of the uuid (or remote id) in bytes as uint16,
+    - the uuid, utf-8 encoded,
+    - the number of events `n` as uint32,
+    - `n` timestamps as int64 milliseconds since epoch (UTC),
+    - `n` values as float64.
+
+    The arrays are read as they are with `numpy.frombuffer`.
+    """
+
+    media_type = 'application/x-ddsc-events'
+    magic = b'DDSC\x01'
+    # the range of datetime64[ns], in ms
+    max_timestamp = np.iinfo(np.int64).max // 10 ** 6
 
     def parse(self, stream, media_type=None, parser_context=None):
-        content = [line.strip().split(',') \
-            for line in stream.read().split('\n') if line.strip()]
-
-        data = [{'uuid':row[1].strip('"'),
-                 'events':[{'datetime':row[0].strip('"'),
-                            'value':row[2].strip('"')}]}
-                for row in content]
-        
+        if self.read(stream, len(self.magic)) != self.magic:
+            raise ParseError('Binary parse error - invalid header')
+        data = SeriesBlocks()
+        while True:
+            header = stream.read(2)
+            if not header:
+                break
+            length = struct.unpack(str('<H'), self.read(stream, 2, header))[0]
+            uuid = self.read(stream, length)
+            count = struct.unpack(str('<I'), self.read(stream, 4))[0]
+            timestamps = np.frombuffer(self.read(stream, 8 * count),
+                                       dtype=str('<i8'))
+            values = np.frombuffer(self.read(stream, 8 * count),
+                                   dtype=str('<f8'))
+            if count and (timestamps.min() < -self.max_timestamp or
+                          timestamps.max() > self.max_timestamp):
+                raise ParseError('Binary parse error - timestamp out of range')
+            # UnicodeDecodeError and OutOfBoundsDatetime are ValueErrors.
+            try:
+                uuid = uuid.decode('utf-8')
+                index = pd.DatetimeIndex(
+                    timestamps.astype(str('datetime64[ms]')))
+            except ValueError as e:
+                raise ParseError('Binary parse error - %s' % e)
+            data.append((uuid, pd.DataFrame({'value': values}, index=index)))
         return DataAndFiles(data, None)
+
+    @staticmethod
+    def read(stream, size, start=b''):
+        """
+        Read exactly `size` bytes, including the bytes in `start`.
+        """
+        content = start
+        while len(content) < size:
+            chunk = stream.read(size - len(content))
+            if not chunk:
+                raise ParseError('Binary parse error - unexpected end of data')
+            content += chunk
+        return content
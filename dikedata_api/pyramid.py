@@ -0,0 +1,133 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+"""
+Multi-resolution cache of pre-decimated events per timeseries.
+
+Every level of the pyramid reduces the raw events with M4 (first, last,
+minimum and maximum value) per bucket of a fixed length, so a level draws
+exactly the same line as the raw events on a graph where a pixel spans at
+least one bucket. Levels are stored in the Django cache in tiles of
+`TILE_BUCKETS` buckets, aligned on the epoch, so writes only invalidate
+the tiles they overlap.
+
+Every tile has a generation, which is part of its cache key and which
+writes replace by a new random one. A tile built from an event store read
+that raced with a write is stored under the old generation, so it is never
+used after the write.
+
+"""
+from __future__ import unicode_literals
+
+import logging
+import random
+
+from django.conf import settings
+from django.core.cache import get_cache
+import numpy as np
+import pandas as pd
+
+from dikedata_api.downsample import m4
+from dikedata_api.utils import (DATETIME64_MS, epoch_ms, from_ms, naive_utc,
+                                to_ms)
+
+logger = logging.getLogger(__name__)
+
+# Bucket lengths of the levels in seconds, from fine to coarse. M4 keeps
+# up to 4 points per bucket, so with 1 minute data these levels hold up to
+# 1/2 and 1/16 of the raw events.
+LEVELS = getattr(settings, 'DIKEDATA_API_PYRAMID_LEVELS', (8 * 60, 64 * 60))
+TILE_BUCKETS = 1024
+CACHE = getattr(settings, 'DIKEDATA_API_PYRAMID_CACHE', 'default')
+TIMEOUT = getattr(settings, 'DIKEDATA_API_PYRAMID_TIMEOUT', 24 * 60 * 60)
+
+
+def select_level(ms_per_pixel):
+    """
+    Return the bucket length in ms of the coarsest level whose buckets are
+    no wider than a pixel, or None if the raw events are needed.
+    """
+    usable = [level * 1000 for level in LEVELS if level * 1000 <= ms_per_pixel]
+    return max(usable) if usable else None
+
+
+def _key(uuid, bucket, tile, generation, ignore_rejected):
+    return 'dikedata_api.pyramid:%s:%d:%d:%s:%d' % (
+        uuid, bucket, tile, generation, bool(ignore_rejected))
+
+
+def _generation_key(uuid, bucket, tile):
+    return 'dikedata_api.pyramid:%s:%d:%d:generation' % (uuid, bucket, tile)
+
+
+def get_events(ts, start, end, bucket, ignore_rejected=None):
+    """
+    Return the events of `ts` between `start` and `end`, reduced to the
+    level with buckets of `bucket` ms, as a DataFrame with a value column.
+
+    Tiles missing from the cache are built from a single event store read.
+    """
+    cache = get_cache(CACHE)
+    span = bucket * TILE_BUCKETS
+    start_ms = to_ms(naive_utc(start))
+    end_ms = to_ms(naive_utc(end))
+    tiles = range(start_ms // span, end_ms // span + 1)
+    # Get the generations before reading the event store.
+    generation_keys = dict((tile, _generation_key(ts.uuid, bucket, tile))
+                           for tile in tiles)
+    generations = cache.get_many(generation_keys.values())
+    keys = dict((tile, _key(ts.uuid, bucket, tile,
+                            generations.get(generation_keys[tile], 0),
+                            ignore_rejected))
+                for tile in tiles)
+    cached = cache.get_many(keys.values())
+
+    missing = [tile for tile in tiles if keys[tile] not in cached]
+    if missing:
+        df = ts.get_events(
+            start=from_ms(missing[0] * span),
+            end=from_ms((missing[-1] + 1) * span - 1),
+            ignore_rejected=ignore_rejected)
+        df = df.dropna(subset=['value'])
+        x = epoch_ms(df.index)
+        y = np.asarray(df['value'].values, dtype=np.float64)
+        built = {}
+        for tile in missing:
+            lo, hi = np.searchsorted(x, [tile * span, (tile + 1) * span])
+            built[keys[tile]] = m4(x[lo:hi], y[lo:hi], TILE_BUCKETS,
+                                   tile * span, (tile + 1) * span)
+        cache.set_many(built, TIMEOUT)
+        cached.update(built)
+        logger.debug('pyramid: built %s tiles of %s ms for %s',
+                     len(missing), bucket, ts.uuid)
+
+    x = np.concatenate([cached[keys[tile]][0] for tile in tiles])
+    y = np.concatenate([cached[keys[tile]][1] for tile in tiles])
+    lo, hi = np.searchsorted(x, [start_ms, end_ms + 1])
+    index = pd.DatetimeIndex(x[lo:hi].astype(DATETIME64_MS))
+    return pd.DataFrame({'value': y[lo:hi]}, index=index)
+
+
+def invalidate(uuid, start, end):
+    """
+    Invalidate the tiles of all levels that overlap `start` to `end`.
+    """
+    invalidate_many([(uuid, start, end)])
+
+
+def invalidate_many(ranges):
+    """
+    Invalidate the tiles that overlap any of the `(uuid, start, end)`
+    ranges, by giving them new generations in one cache call.
+    """
+    generations = {}
+    for uuid, start, end in ranges:
+        start_ms = to_ms(naive_utc(start))
+        end_ms = to_ms(naive_utc(end))
+        for level in LEVELS:
+            bucket = level * 1000
+            span = bucket * TILE_BUCKETS
+            for tile in range(start_ms // span, end_ms // span + 1):
+                generations[_generation_key(uuid, bucket, tile)] = \
+                    '%x' % random.getrandbits(64)
+    if generations:
+        # As long as the tiles, so a tile can't outlive its generation.
+        get_cache(CACHE).set_many(generations, TIMEOUT)
@@ -0,0 +1,47 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+"""
+Vectorized helpers for scatter plots of one timeseries against another.
+"""
+from __future__ import unicode_literals
+
+import numpy as np
+
+
+def align_nearest(x_times, x_values, y_times, y_values, tolerance):
+    """
+    Pair every x event with the nearest y event in time.
+
+    Times are sorted int64 ms since epoch. Pairs that are more than
+    `tolerance` ms apart are left out. Returns the paired x and y values.
+    """
+    if len(x_times) == 0 or len(y_times) == 0:
+        return x_values[:0], y_values[:0]
+    right = np.clip(np.searchsorted(y_times, x_times), 0, len(y_times) - 1)
+    left = np.clip(right - 1, 0, len(y_times) - 1)
+    nearest = np.where(
+        np.absolute(x_times - y_times[left]) <=
+        np.absolute(y_times[right] - x_times), left, right)
+    keep = np.absolute(y_times[nearest] - x_times) <= tolerance
+    return x_values[keep], y_values[nearest[keep]]
+
+
+def grid_reduce(x, y, columns, rows):
+    """
+    Keep one point per occupied cell of a `columns` by `rows` grid over
+    the range of the points, which draws the same scatter plot when a cell
+    is a pixel.
+    """
+    if len(x) == 0:
+        return x, y
+
+    def cell(a, size):
+        low, high = a.min(), a.max()
+        if high <= low:
+            return np.zeros(len(a), dtype=np.int64)
+        index = ((a - low) * (size / float(high - low))).astype(np.int64)
+        return np.clip(index, 0, size - 1)
+
+    cells = cell(x, columns) * rows + cell(y, rows)
+    _, first = np.unique(cells, return_index=True)
+    first.sort()
+    return x[first], y[first]
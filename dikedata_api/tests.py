@@ -1,9 +1,590 @@
 # (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
 
+from datetime import datetime, timedelta
+from io import BytesIO
+import os
+import shutil
+import struct
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.cache import get_cache
+from django.http import HttpResponse
 from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils.http import http_date
+from rest_framework.exceptions import ParseError
+from rest_framework.request import Request
+import numpy as np
+import pandas as pd
+
+from dikedata_api import (aggregation, conditional, douglas_peucker,
+                          downsample, eventcache, eventindex, ingest, lookup,
+                          metrics, pyramid, scatter, utils)
+from dikedata_api.parsers import BinaryEventsParser, CSVParser
+from dikedata_api.renderers import CSVRenderer
+from dikedata_api.views import (EventList, decode_cursor, encode_cursor,
+                                get_events_page)
 
 
 class ExampleTest(TestCase):
 
     def test_something(self):
         self.assertEquals(1, 1)
+
+
+class FormatDatetimesTest(TestCase):
+
+    def test_matches_strftime(self):
+        index = pd.date_range('2012-01-01 00:00:00.123', periods=3, freq='H')
+        expected = [t.strftime('%Y-%m-%dT%H:%M:%S.%fZ') for t in index]
+        self.assertEquals(utils.format_datetimes(index), expected)
+
+    def test_separator_and_suffix(self):
+        index = pd.date_range('2012-01-01', periods=1, freq='H')
+        self.assertEquals(utils.format_datetimes(index, sep=' ', suffix=''),
+                          ['2012-01-01 00:00:00.000000'])
+
+
+class AggregationTest(TestCase):
+
+    def test_parse_interval(self):
+        self.assertEquals(aggregation.parse_interval('15min'), 15 * 60 * 1000)
+        self.assertEquals(aggregation.parse_interval('H'), 60 * 60 * 1000)
+        self.assertRaises(ValueError, aggregation.parse_interval, '1Q')
+
+    def test_aggregate_per_hour(self):
+        index = pd.date_range('2012-01-01 00:30', periods=6, freq='20min')
+        values = np.arange(6.0)
+        values[3] = np.nan
+        result = aggregation.aggregate(
+            utils.epoch_ms(index), values, aggregation.parse_interval('1H'))
+        self.assertEquals(result['min'].tolist(), [0.0, 2.0, 5.0])
+        self.assertEquals(result['max'].tolist(), [1.0, 4.0, 5.0])
+        self.assertEquals(result['mean'].tolist(), [0.5, 3.0, 5.0])
+        self.assertEquals(result['count'].tolist(), [2, 2, 1])
+
+
+class DownsampleTest(TestCase):
+
+    def setUp(self):
+        self.x = np.arange(10000, dtype=float)
+        self.y = np.sin(self.x / 100.0)
+
+    def test_m4_keeps_extremes(self):
+        x, y = downsample.m4(self.x, self.y, 100)
+        self.assertTrue(len(x) <= 400)
+        self.assertEquals(y.min(), self.y.min())
+        self.assertEquals(y.max(), self.y.max())
+        self.assertEquals((x[0], x[-1]), (self.x[0], self.x[-1]))
+
+    def test_lttb_exact_size(self):
+        x, y = downsample.lttb(self.x, self.y, 500)
+        self.assertEquals(len(x), 500)
+        self.assertEquals((x[0], x[-1]), (self.x[0], self.x[-1]))
+
+
+class SignificanceTest(TestCase):
+
+    def setUp(self):
+        self.x = np.arange(2000, dtype=float)
+        self.y = np.cumsum(np.random.RandomState(0).normal(size=2000))
+
+    def test_matches_decimate(self):
+        sig = douglas_peucker.significance(self.x, self.y)
+        for tolerance in (0.1, 1.0, 10.0):
+            x, y = douglas_peucker.decimate(
+                self.x.copy(), self.y.copy(), tolerance)
+            self.assertEquals(x.tolist(), self.x[sig > tolerance].tolist())
+
+    def test_decimate_top(self):
+        x, y = douglas_peucker.decimate_top(self.x, self.y, 100)
+        self.assertEquals(len(x), 100)
+
+    def test_decimate_2d(self):
+        tolerance_w = (self.x[-1] - self.x[0]) / 100.0
+        tolerance_h = (self.y.max() - self.y.min()) / 50.0
+        x, y = douglas_peucker.decimate_2d(
+            self.x, self.y, tolerance_w, tolerance_h)
+        self.assertTrue(2 < len(x) < len(self.x))
+        x, y = douglas_peucker.decimate_2d(
+            self.x, self.y, tolerance_w, tolerance_h, max_values=10)
+        self.assertEquals(len(x), 10)
+
+
+class ConditionalTest(TestCase):
+
+    def test_if_none_match(self):
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH='"abc"')
+        self.assertTrue(conditional.is_not_modified(request, 'abc', 0))
+        self.assertFalse(conditional.is_not_modified(request, 'def', 0))
+
+    def test_if_modified_since(self):
+        request = RequestFactory().get(
+            '/', HTTP_IF_MODIFIED_SINCE=http_date(1000000))
+        self.assertTrue(conditional.is_not_modified(request, 'abc', 1000000))
+        self.assertFalse(conditional.is_not_modified(request, 'abc', 1000001))
+        self.assertFalse(conditional.is_not_modified(request, 'abc'))
+
+
+class CSVRendererTest(TestCase):
+
+    def test_render_chunks(self):
+        data = pd.DataFrame(
+            {'value': [1.5, np.nan, 3.0], 'flag': [0, 1, 0]},
+            index=pd.date_range('2012-01-01', periods=3, freq='H'),
+            columns=['value', 'flag'])
+        chunks = list(CSVRenderer().render_chunks(data, chunk_size=2))
+        self.assertEquals(len(chunks), 3)
+        self.assertEquals(''.join(chunks),
+                          '"datetime (utc)";"value";"flag"\n'
+                          '"2012-01-01 00:00:00.000000";"1.5";"0.0"\n'
+                          '"2012-01-01 01:00:00.000000";"nan";"1.0"\n'
+                          '"2012-01-01 02:00:00.000000";"3.0";"0.0"\n')
+
+
+class IterMergedTest(TestCase):
+
+    def test_outer_join(self):
+        a = np.array(['2012-01-01T00', '2012-01-01T02', '2012-01-01T03'],
+                     dtype=str('datetime64[ns]'))
+        b = np.array(['2012-01-01T01', '2012-01-01T02'],
+                     dtype=str('datetime64[ns]'))
+        blocks = list(utils.iter_merged([a, b], [np.arange(3.0),
+                                                 np.arange(2.0)], 2))
+        timestamps = np.concatenate([block[0] for block in blocks])
+        first = np.concatenate([block[1][0] for block in blocks])
+        second = np.concatenate([block[1][1] for block in blocks])
+        self.assertEquals(len(timestamps), 4)
+        np.testing.assert_array_equal(first, [0, np.nan, 1, 2])
+        np.testing.assert_array_equal(second, [np.nan, 0, 1, np.nan])
+
+
+class MetricsTest(TestCase):
+
+    def test_finish(self):
+        metrics.reset()
+        request = RequestFactory().get('/')
+        metrics.add(request, 'store', 12.0)
+        metrics.add(request, 'store', 3.0)
+        metrics.add(request, 'format', 1.5)
+        response = metrics.finish(request, HttpResponse(), 'EventList')
+        self.assertEquals(response['Server-Timing'],
+                          'store;dur=15.0, format;dur=1.5')
+        histograms = metrics.snapshot()
+        self.assertEquals(histograms['EventList.store']['count'], 1)
+        self.assertEquals(histograms['EventList.store']['p50'], 15.0)
+
+    def test_threads(self):
+        request = RequestFactory().get('/')
+        with metrics.threads(request, 'store'):
+            metrics.add(request, 'format', 2.0)
+            metrics.add(request, 'format', 3.0)
+        metrics.add(request, 'render', 1.0)
+        self.assertEquals(list(request._stage_timings),
+                          ['store.format', 'store', 'render'])
+        self.assertEquals(request._stage_timings['store.format'], 5.0)
+
+
+class LRUCacheTest(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = lookup.LRUCache(2, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEquals(cache.get('a'), 1)
+        self.assertEquals(cache.get('b'), None)
+        self.assertEquals(cache.get('c'), 3)
+
+    def test_expires(self):
+        cache = lookup.LRUCache(2, -1)
+        cache.set('a', 1)
+        self.assertEquals(cache.get('a'), None)
+
+
+
+class EventCacheTest(TestCase):
+
+    def setUp(self):
+        self.request = RequestFactory().get('/', {'eventsformat': 'flot'})
+
+    def test_write_during_read(self):
+        key = eventcache.get_key(['a'], self.request)
+        # A write lands after the event store read, before the store.
+        eventcache.invalidate_many(['a'])
+        eventcache.store(key, 'stale')
+        self.assertEquals(
+            eventcache.get(eventcache.get_key(['a'], self.request)), None)
+
+    def test_invalidate(self):
+        key = eventcache.get_key(['b', 'c'], self.request)
+        eventcache.store(key, 'events')
+        self.assertEquals(eventcache.get(
+            eventcache.get_key(['b', 'c'], self.request)), 'events')
+        eventcache.invalidate('d')
+        self.assertEquals(eventcache.get(
+            eventcache.get_key(['b', 'c'], self.request)), 'events')
+        eventcache.invalidate('c')
+        self.assertEquals(eventcache.get(
+            eventcache.get_key(['b', 'c'], self.request)), None)
+
+
+class CSVParserTest(TestCase):
+
+    def test_blocks_per_uuid(self):
+        stream = BytesIO(b'"2012-01-01T00:00:00Z","abc","1.5"\n'
+                         b'2012-01-01T00:01:00Z,007,2\n'
+                         b'\n'
+                         b'2012-01-01T00:02:00Z,abc,3\n')
+        parser = CSVParser()
+        parser.chunk_size = 2
+        blocks = dict(parser.parse(stream).data)
+        self.assertEquals(sorted(blocks), ['007', 'abc'])
+        self.assertEquals(blocks['abc']['value'].tolist(), [1.5, 3.0])
+        self.assertEquals(blocks['abc'].index[1],
+                          pd.Timestamp('2012-01-01 00:02:00'))
+
+
+class IngestQueueTest(TestCase):
+
+    def setUp(self):
+        self.spool = ingest.SPOOL
+        ingest.SPOOL = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(ingest.SPOOL)
+        ingest.SPOOL = self.spool
+
+    def test_enqueue_and_claim(self):
+        data = [{'uuid': 'abc', 'events': [{'datetime': '2012-01-01T00:00:00Z',
+                                            'value': '1.0'}]}]
+        job = ingest.enqueue(User(pk=1), data, 1, 1)
+        self.assertEquals(ingest.get_job(job['id'])['status'], 'queued')
+        self.assertEquals(ingest.claim(), job['id'])
+        self.assertEquals(ingest.claim(), None)
+        self.assertEquals(ingest.requeue(), 1)
+        self.assertEquals(ingest.claim(), job['id'])
+
+    def test_run_without_status(self):
+        job = ingest.enqueue(User(pk=1), [], 0, 0)
+        os.remove(os.path.join(ingest.SPOOL, 'jobs', job['id'] + '.json'))
+        self.assertEquals(ingest.claim(), job['id'])
+        self.assertEquals(ingest.run(job['id']), None)
+        self.assertEquals(ingest.requeue(), 0)
+
+    def test_unknown_job(self):
+        self.assertEquals(ingest.get_job('../../etc/passwd'), None)
+        self.assertEquals(ingest.get_job('0' * 32), None)
+
+
+class CSVParserMissingFieldTest(TestCase):
+
+    def test_missing_value(self):
+        stream = BytesIO(b'2012-01-01T00:00:00Z,abc,1\n'
+                         b'\n'
+                         b'2012-01-01T00:01:00Z,abc,2\n'
+                         b'2012-01-01T00:02:00Z,abc,\n')
+        parser = CSVParser()
+        parser.chunk_size = 2
+        with self.assertRaisesRegexp(ParseError, 'missing value in row 3'):
+            parser.parse(stream)
+
+    def test_missing_uuid(self):
+        stream = BytesIO(b'2012-01-01T00:00:00Z,,1\n')
+        with self.assertRaisesRegexp(ParseError, 'missing uuid in row 1'):
+            CSVParser().parse(stream)
+
+    def test_empty(self):
+        parser = CSVParser()
+        for content in (b'', b'\n\n'):
+            for chunk_size in (1, 2, 100):
+                parser.chunk_size = chunk_size
+                self.assertEquals(parser.parse(BytesIO(content)).data, [])
+
+
+class BinaryEventsParserTest(TestCase):
+
+    def test_parse(self):
+        timestamps = np.array([0, 60000], dtype=str('<i8'))
+        values = np.array([1.5, 2.5], dtype=str('<f8'))
+        stream = BytesIO(b'DDSC\x01' + struct.pack(str('<H'), 3) + b'abc' +
+                         struct.pack(str('<I'), 2) + timestamps.tostring() +
+                         values.tostring())
+        [(uuid, df)] = BinaryEventsParser().parse(stream).data
+        self.assertEquals(uuid, 'abc')
+        self.assertEquals(df['value'].tolist(), [1.5, 2.5])
+        self.assertEquals(df.index[1], pd.Timestamp('1970-01-01 00:01:00'))
+
+    def test_truncated(self):
+        stream = BytesIO(b'DDSC\x01' + struct.pack(str('<H'), 3) + b'ab')
+        self.assertRaises(ParseError, BinaryEventsParser().parse, stream)
+
+    def test_invalid_uuid(self):
+        stream = BytesIO(b'DDSC\x01' + struct.pack(str('<H'), 2) + b'\xff\xfe' +
+                         struct.pack(str('<I'), 0))
+        self.assertRaises(ParseError, BinaryEventsParser().parse, stream)
+
+    def test_timestamp_out_of_bounds(self):
+        stream = BytesIO(b'DDSC\x01' + struct.pack(str('<H'), 3) + b'abc' +
+                         struct.pack(str('<I'), 1) +
+                         struct.pack(str('<q'), 2 ** 62) +
+                         struct.pack(str('<d'), 1.0))
+        self.assertRaises(ParseError, BinaryEventsParser().parse, stream)
+
+
+class FakeSource(object):
+
+    def __init__(self, frequency):
+        self.frequency = frequency
+
+
+class FakeParameter(object):
+    pk = 1
+
+
+class FakeTimeseries(object):
+    """
+    Timeseries with the events of `index` that records its reads.
+    """
+
+    uuid = 'fake'
+    parameter = unit = FakeParameter()
+
+    def __init__(self, index, frequency=60):
+        self.events = pd.DataFrame(
+            {'value': np.arange(len(index), dtype=float)}, index=index)
+        self.first_value_timestamp = index[0].to_pydatetime()
+        self.latest_value_timestamp = index[-1].to_pydatetime()
+        self.source = FakeSource(frequency)
+        self.reads = []
+
+    def get_events(self, start=None, end=None, **kwargs):
+        self.reads.append((start, end))
+        return self.events[start:end]
+
+
+class EventsPageTest(TestCase):
+
+    def test_page_size_boundaries(self):
+        ts = FakeTimeseries(pd.date_range('2012-01-01', periods=10, freq='T'))
+        df, more = get_events_page(ts, None, None, 10)
+        self.assertEquals(len(df), 10)
+        self.assertFalse(more)
+        df, more = get_events_page(ts, None, None, 9)
+        self.assertEquals(len(df), 9)
+        self.assertTrue(more)
+        df, more = get_events_page(ts, datetime(2012, 1, 1, 0, 5), None, 5)
+        self.assertEquals(df.index[0], pd.Timestamp('2012-01-01 00:05'))
+        self.assertEquals(len(df), 5)
+        self.assertFalse(more)
+
+    def test_gap_longer_than_window(self):
+        ts = FakeTimeseries(pd.DatetimeIndex(
+            ['2012-01-01 00:00', '2012-01-02 00:00', '2012-01-02 00:01']))
+        df, more = get_events_page(ts, None, None, 2)
+        self.assertEquals(list(df.index), [pd.Timestamp('2012-01-01'),
+                                           pd.Timestamp('2012-01-02')])
+        self.assertTrue(more)
+        self.assertTrue(len(ts.reads) > 2)
+        # The windows follow each other without overlap.
+        for (start, end), (next_start, next_end) in zip(ts.reads,
+                                                        ts.reads[1:]):
+            self.assertEquals(next_start, end + timedelta(microseconds=1))
+
+    def test_end_clipped_to_latest(self):
+        ts = FakeTimeseries(pd.date_range('2012-01-01', periods=3, freq='T'))
+        df, more = get_events_page(ts, None, datetime(2013, 1, 1), 10)
+        self.assertEquals(len(df), 3)
+        self.assertFalse(more)
+        self.assertEquals(ts.reads, [(datetime(2012, 1, 1),
+                                      datetime(2012, 1, 1, 0, 2))])
+
+    def test_cursor(self):
+        timestamp = datetime(2012, 1, 1, 12, 30, 0, 123000)
+        self.assertEquals(decode_cursor(encode_cursor(timestamp)), timestamp)
+        self.assertRaises(ParseError, decode_cursor, 'not a cursor')
+        self.assertRaises(ParseError, decode_cursor, 'YWJj')
+
+
+
+class FlotFallbackTest(TestCase):
+
+    def test_m4_of_latest_events(self):
+        ts = FakeTimeseries(pd.date_range('2012-01-01', periods=1440, freq='T'))
+        request = Request(RequestFactory().get('/', {'downsample': 'm4',
+                                                     'width': '100'}))
+        line, latest = EventList.get_flot(request, ts, datetime(2012, 2, 1),
+                                          datetime(2012, 2, 2))
+        self.assertTrue(latest)
+        # Bucketed over the window of the latest events, not the empty one.
+        self.assertTrue(100 < len(line['data']) <= 400)
+
+
+
+
+class EventIndexTest(TestCase):
+
+    def setUp(self):
+        get_cache(eventindex.CACHE).clear()
+        self.fallback_events = eventindex.FALLBACK_EVENTS
+        self.ts = FakeTimeseries(
+            pd.date_range('2012-01-01', periods=3 * 24 * 60, freq='T'))
+
+    def tearDown(self):
+        eventindex.FALLBACK_EVENTS = self.fallback_events
+
+    def day_counts(self):
+        return get_cache(eventindex.CACHE).get(eventindex._key(self.ts.uuid))
+
+    def test_record(self):
+        index = self.ts.events.index
+        eventindex.record_many([(self.ts.uuid, index[:10])])
+        eventindex.record_many([(self.ts.uuid, index[5:1440]),
+                                (self.ts.uuid, index[-1:])])
+        day = utils.to_ms(datetime(2012, 1, 1)) // eventindex.DAY
+        # Events written again are counted again.
+        self.assertEquals(self.day_counts(), {day: 1445, day + 2: 1})
+
+    def test_max_days(self):
+        index = pd.date_range('2000-01-01', periods=eventindex.MAX_DAYS + 2,
+                              freq='D')
+        eventindex.record(self.ts.uuid, index)
+        day_counts = self.day_counts()
+        self.assertEquals(len(day_counts), eventindex.MAX_DAYS)
+        self.assertEquals(min(day_counts),
+                          utils.to_ms(datetime(2000, 1, 3)) // eventindex.DAY)
+
+    def test_fallback_window(self):
+        eventindex.record(self.ts.uuid, self.ts.events.index)
+        start, end = datetime(2012, 2, 1), datetime(2012, 2, 11)
+        latest = datetime(2012, 1, 3, 23, 59)
+        self.assertEquals(eventindex.fallback_window(self.ts, start, end),
+                          (latest - timedelta(days=10), latest))
+        eventindex.FALLBACK_EVENTS = 2000
+        self.assertEquals(eventindex.fallback_window(self.ts, start, end),
+                          (datetime(2012, 1, 2), latest))
+
+    def test_window_is_empty(self):
+        self.assertTrue(eventindex.window_is_empty(
+            self.ts, datetime(2011, 12, 1), datetime(2011, 12, 31)))
+        self.assertTrue(eventindex.window_is_empty(
+            self.ts, datetime(2012, 1, 4), datetime(2012, 1, 5)))
+        self.assertFalse(eventindex.window_is_empty(
+            self.ts, datetime(2011, 12, 31), datetime(2012, 1, 2)))
+        self.assertFalse(eventindex.window_is_empty(self.ts, None, None))
+        self.ts.latest_value_timestamp = None
+        self.assertTrue(eventindex.window_is_empty(self.ts, None, None))
+
+
+class PyramidTest(TestCase):
+
+    bucket = 8 * 60 * 1000
+
+    def setUp(self):
+        get_cache(pyramid.CACHE).clear()
+        self.ts = FakeTimeseries(
+            pd.date_range('2012-01-01', periods=20 * 24 * 60, freq='T'))
+
+    def get_events(self, start, end):
+        return pyramid.get_events(self.ts, start, end, self.bucket)
+
+    def test_reuses_tiles(self):
+        start, end = datetime(2012, 1, 2), datetime(2012, 1, 10)
+        df = self.get_events(start, end)
+        self.assertEquals(len(self.ts.reads), 1)
+        self.assertTrue(0 < len(df) <= len(self.ts.events[start:end]) / 2)
+        self.assertTrue(df.index[0] >= start and df.index[-1] <= end)
+        again = self.get_events(start, end)
+        np.testing.assert_array_equal(again.index, df.index)
+        np.testing.assert_array_equal(again['value'], df['value'])
+        self.assertEquals(len(self.ts.reads), 1)
+
+    def test_invalidate(self):
+        start, end = datetime(2012, 1, 2), datetime(2012, 1, 15)
+        self.get_events(start, end)
+        pyramid.invalidate(self.ts.uuid, datetime(2012, 1, 9),
+                           datetime(2012, 1, 9))
+        self.get_events(start, end)
+        self.assertEquals(len(self.ts.reads), 2)
+        # Only the tile of the write is read again.
+        read_start, read_end = self.ts.reads[1]
+        span = timedelta(milliseconds=self.bucket * pyramid.TILE_BUCKETS)
+        self.assertTrue(read_start <= datetime(2012, 1, 9) <= read_end)
+        self.assertTrue(read_end - read_start < span)
+        self.get_events(start, end)
+        self.assertEquals(len(self.ts.reads), 2)
+
+    def test_write_during_read(self):
+        start, end = datetime(2012, 1, 2), datetime(2012, 1, 3)
+        get_events = self.ts.get_events
+
+        def racing_get_events(**kwargs):
+            # A write lands after the event store read.
+            df = get_events(**kwargs)
+            pyramid.invalidate(self.ts.uuid, start, start)
+            return df
+        self.ts.get_events = racing_get_events
+        self.get_events(start, end)
+        self.ts.get_events = get_events
+        self.get_events(start, end)
+        self.assertEquals(len(self.ts.reads), 2)
+
+    def test_window_past_cached_tiles(self):
+        self.get_events(datetime(2012, 1, 2), datetime(2012, 1, 3))
+        df = self.get_events(datetime(2012, 1, 2), datetime(2012, 1, 19))
+        self.assertEquals(len(self.ts.reads), 2)
+        self.assertTrue(self.ts.reads[1][0] > self.ts.reads[0][1])
+        self.assertTrue(df.index[-1] > datetime(2012, 1, 18))
+
+
+class AlignNearestTest(TestCase):
+
+    def align(self, x_times, y_times, tolerance):
+        x_times = np.array(x_times, dtype=np.int64)
+        y_times = np.array(y_times, dtype=np.int64)
+        return scatter.align_nearest(
+            x_times, np.arange(len(x_times), dtype=float),
+            y_times, np.arange(len(y_times), dtype=float), tolerance)
+
+    def test_tolerance(self):
+        x, y = self.align([0, 100, 1010], [10, 1000], 10)
+        np.testing.assert_array_equal(x, [0, 2])
+        np.testing.assert_array_equal(y, [0, 1])
+
+    def test_nearest(self):
+        # A tie goes to the earlier y event.
+        x, y = self.align([-5, 10, 11, 30], [0, 20], 100)
+        np.testing.assert_array_equal(x, [0, 1, 2, 3])
+        np.testing.assert_array_equal(y, [0, 0, 1, 1])
+
+    def test_empty(self):
+        for x_times, y_times in (([], [0, 1]), ([0, 1], []), ([], [])):
+            x, y = self.align(x_times, y_times, 10)
+            self.assertEquals(len(x), 0)
+            self.assertEquals(len(y), 0)
+
+
+class GridReduceTest(TestCase):
+
+    def test_one_point_per_cell(self):
+        x = np.array([0.0, 0.1, 1.0, 0.9, 0.05])
+        y = np.array([0.0, 0.1, 1.0, 0.9, 1.0])
+        rx, ry = scatter.grid_reduce(x, y, 2, 2)
+        np.testing.assert_array_equal(rx, [0.0, 1.0, 0.05])
+        np.testing.assert_array_equal(ry, [0.0, 1.0, 1.0])
+
+    def test_constant_axis(self):
+        x = np.array([5.0, 5.0, 5.0, 5.0])
+        y = np.array([0.0, 1.0, 2.0, 3.0])
+        rx, ry = scatter.grid_reduce(x, y, 10, 2)
+        np.testing.assert_array_equal(rx, [5.0, 5.0])
+        np.testing.assert_array_equal(ry, [0.0, 2.0])
+        rx, ry = scatter.grid_reduce(x, x, 10, 10)
+        np.testing.assert_array_equal(rx, [5.0])
+
+    def test_empty(self):
+        rx, ry = scatter.grid_reduce(np.array([]), np.array([]), 10, 10)
+        self.assertEquals(len(rx), 0)
+        self.assertEquals(len(ry), 0)
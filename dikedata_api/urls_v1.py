@@ -133,6 +133,12 @@ urlpatterns = patterns(
     url(r'^summary/?$',
         views.Summary.as_view(),
         name='summary'),
+    url(r'^metrics/?$',
+        views.Metrics.as_view(),
+        name='metrics'),
+    url(r'^ingestjobs/(?P<pk>[0-9a-f]{32})/?$',
+        views.IngestJobDetail.as_view(),
+        name='ingestjob-detail'),
 
 
 )
@@ -0,0 +1,167 @@
+# (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
+from __future__ import unicode_literals
+
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
+import calendar
+import json
+
+from django.db import connection
+from django.utils import timezone
+from rest_framework.reverse import reverse
+from rest_framework.utils.encoders import JSONEncoder
+import numpy as np
+
+# NumPy on Python 2 doesn't understand dtype names given as unicode.
+DATETIME64_MS = np.dtype(str('datetime64[ms]'))
+
+
+def naive_utc(value):
+    """
+    Return `value` as a naive datetime in UTC, like the event store uses.
+    """
+    if value is not None and timezone.is_aware(value):
+        return timezone.make_naive(value, timezone.utc)
+    return value
+
+
+def to_ms(dt):
+    """Return a naive UTC datetime as milliseconds since epoch."""
+    return calendar.timegm(dt.timetuple()) * 1000 + dt.microsecond // 1000
+
+
+def from_ms(ms):
+    """Return milliseconds since epoch as a naive UTC datetime."""
+    return datetime(1970, 1, 1) + timedelta(milliseconds=int(ms))
+
+
+def format_datetimes(index, unit='us', sep='T', suffix='Z', prefix=''):
+    """
+    Format all timestamps of a DatetimeIndex (or datetime64 array) in one
+    vectorized pass.
+
+    With the defaults this is equivalent to calling
+    `strftime('%Y-%m-%dT%H:%M:%S.%fZ')` on every timestamp, without
+    creating a Python datetime per row.
+    """
+    values = np.asarray(getattr(index, 'values', index))
+    values = values.astype(np.dtype(str('datetime64[%s]' % unit)))
+    strings = np.datetime_as_string(values)
+    if sep != 'T':
+        strings = np.char.replace(strings, 'T', sep)
+    if suffix:
+        strings = np.char.add(strings, suffix)
+    if prefix:
+        strings = np.char.add(prefix, strings)
+    return strings.tolist()
+
+
+def event_detail_url_format(request):
+    """
+    Return the url of an event of a file timeseries as a format string with
+    `{uuid}` and `{dt}` fields, resolving the url only once per request.
+    """
+    url_format = getattr(request, '_event_detail_url_format', None)
+    if url_format is None:
+        url = reverse('event-detail', args=['UUIDFIELD', 'DTFIELD'],
+                      request=request)
+        url_format = url.replace('{', '{{').replace('}', '}}') \
+            .replace('UUIDFIELD', '{uuid}').replace('DTFIELD', '{dt}')
+        request._event_detail_url_format = url_format
+    return url_format
+
+
+def epoch_ms(index):
+    """
+    Return the timestamps of a DatetimeIndex as int64 milliseconds since epoch.
+    """
+    return np.asarray(index.values).astype(DATETIME64_MS).view(np.int64)
+
+
+def iter_chunks(df, chunk_size):
+    """
+    Yield consecutive row blocks of at most `chunk_size` rows.
+    """
+    for i in range(0, len(df), chunk_size):
+        yield df[i:i + chunk_size]
+
+
+def iter_merged(indexes, values, chunk_size):
+    """
+    Outer join sorted series on their timestamps with a k-way merge, block
+    by block.
+
+    `indexes` holds a sorted datetime64 array per series and `values` the
+    matching value arrays. Yields the timestamps of a block and a float
+    array per series, with NaN where a series has no value. Every block
+    takes at most `chunk_size` events from each series.
+    """
+    positions = [0] * len(indexes)
+    while True:
+        ends = [min(position + chunk_size, len(index))
+                for position, index in zip(positions, indexes)]
+        # The block ends at the first timestamp that some series can't
+        # take past in this block, so no series is cut off too early.
+        bounds = [index[end - 1] for position, end, index
+                  in zip(positions, ends, indexes) if end > position]
+        if not bounds:
+            return
+        bound = min(bounds)
+        ends = [position + np.searchsorted(index[position:], bound, 'right')
+                for position, index in zip(positions, indexes)]
+        timestamps = np.unique(np.concatenate(
+            [index[position:end] for position, end, index
+             in zip(positions, ends, indexes)]))
+        columns = []
+        for position, end, index, column in zip(positions, ends, indexes,
+                                                values):
+            merged = np.empty(len(timestamps), dtype=np.float64)
+            merged.fill(np.nan)
+            merged[np.searchsorted(timestamps, index[position:end])] = \
+                column[position:end]
+            columns.append(merged)
+        yield timestamps, columns
+        positions = ends
+
+
+def iter_json_list(chunks):
+    """
+    Serialize an iterable of lists as one JSON array, chunk by chunk.
+    """
+    yield '['
+    first = True
+    for items in chunks:
+        if not items:
+            continue
+        content = json.dumps(items, cls=JSONEncoder)[1:-1]
+        if first:
+            first = False
+            yield content
+        else:
+            yield ',' + content
+    yield ']'
+
+
+def parallel_map(func, items, threads):
+    """
+    Return `[func(item) for item in items]`, calling `func` concurrently on
+    at most `threads` threads. Meant for I/O bound work like event store
+    reads. The first exception raised by `func` is re-raised.
+    """
+    items = list(items)
+    if threads <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    def call(item):
+        try:
+            return func(item)
+        finally:
+            # Don't leak the database connection of this thread.
+            connection.close()
+
+    pool = ThreadPool(min(threads, len(items)))
+    try:
+        return pool.map(call, items)
+    finally:
+        pool.close()
+        pool.join()
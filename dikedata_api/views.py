@@ -1,20 +1,24 @@
 # (c) Nelen & Schuurmans.  MIT licensed, see LICENSE.rst.
 from __future__ import unicode_literals
 
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import base64
 import calendar
 import json
 import logging
 import mimetypes
 import numpy as np
+import pandas as pd
 import requests
 import time
 
+from django.conf import settings
 from django.contrib.auth.models import User, Group as Role
 from django.core.exceptions import ValidationError
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db.models import Sum
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.db.models import Q
 
 from rest_framework import exceptions as ex, generics
@@ -27,6 +31,7 @@ from rest_framework.pagination import PaginationSerializer
 from rest_framework.exceptions import ParseError
 from rest_framework import status
 from rest_framework.request import clone_request
+from rest_framework.templatetags.rest_framework import replace_query_param
 from haystack.query import SearchQuerySet
 
 
@@ -35,8 +40,8 @@ from lizard_security.models import (
 )
 
 from ddsc_core.auth import PERMISSION_CHANGE
-from ddsc_core.models import (Alarm, Alarm_Active, Alarm_Item, IdMapping,
-                              Location, LogicalGroup, LogicalGroupEdge, Source,
+from ddsc_core.models import (Alarm, Alarm_Active, Alarm_Item, Location,
+                              LogicalGroup, LogicalGroupEdge, Source,
                               Timeseries, Manufacturer, StatusCache)
 from ddsc_core.models.aquo import Compartment
 from ddsc_core.models.aquo import MeasuringDevice
@@ -46,10 +51,17 @@ from ddsc_core.models.aquo import ProcessingMethod
 from ddsc_core.models.aquo import ReferenceFrame
 from ddsc_core.models.aquo import Unit
 
-from dikedata_api import mixins, serializers
-from dikedata_api.parsers import CSVParser
-from dikedata_api.douglas_peucker import decimate_until
-from dikedata_api.renderers import CSVRenderer
+from dikedata_api import (access, aggregation, conditional, eventcache,
+                          eventindex, ingest, lookup, metadata, metrics,
+                          mixins, pyramid, serializers)
+from dikedata_api.parsers import BinaryEventsParser, CSVParser, SeriesBlocks
+from dikedata_api.douglas_peucker import decimate_2d, decimate_until
+from dikedata_api.downsample import DOWNSAMPLERS, lttb, m4
+from dikedata_api.renderers import CSVRenderer, NumpyRenderer
+from dikedata_api.scatter import align_nearest, grid_reduce
+from dikedata_api.utils import (epoch_ms, event_detail_url_format,
+                                format_datetimes, iter_chunks, iter_json_list,
+                                iter_merged, naive_utc, parallel_map, to_ms)
 
 from tslib.readers import ListReader
 
@@ -60,6 +72,18 @@ COLNAME_FORMAT_MS = '%Y-%m-%dT%H:%M:%S.%fZ'  # supports milliseconds
 FILENAME_FORMAT = '%Y-%m-%dT%H.%M.%S.%fZ'
 GEOSERVER_FORMAT = COLNAME_FORMAT  # used in geoserver
 
+# Maximum number of points in a flot line when the graph width is unknown.
+MAX_VALUES = 1200
+# Grid size to reduce a scatter plot of more than MAX_VALUES points to,
+# when the graph size is unknown.
+SCATTER_GRID_SIZE = 300
+# Number of events formatted at a time when streaming event responses.
+EVENTS_CHUNK_SIZE = getattr(settings, 'DIKEDATA_API_EVENTS_CHUNK_SIZE', 10000)
+# Number of timeseries read from the event store at the same time.
+FETCH_THREADS = getattr(settings, 'DIKEDATA_API_FETCH_THREADS', 8)
+# Number of timeseries written to the event store at the same time.
+WRITE_THREADS = getattr(settings, 'DIKEDATA_API_WRITE_THREADS', 8)
+
 mimetypes.init()
 
 BOOL_LOOKUPS = ("isnull",)
@@ -148,33 +172,159 @@ def customfilter(view, qs, filter_json=None, order_field=None):
     return qs
 
 
+def writable_series(user, keys):
+    """
+    Return a dict of the timeseries of `keys` (uuids or remote ids), if
+    `user` may change all of them.
+    """
+    series = lookup.resolve(user, keys)
+    allowed = access.changeable_ids(user, series.values())
+    if any(ts.pk not in allowed for ts in series.values()):
+        raise ex.PermissionDenied("Permission denied")
+    return series
+
+
 def write_events(user, data):
+    """
+    Write the events in `data` for `user`, several series at the same time.
+
+    Returns the number of events written, the number of timeseries and
+    locations, and a dict of the exceptions raised while writing series, by
+    uuid. Events of the other series are written anyway.
+    """
     if user is None:
         raise ex.NotAuthenticated("User not logged in.")
-    reader = ListReader(data)
-    permission = True
     locations = {}
-    series = {}
-    events = []
+    if isinstance(data, SeriesBlocks):
+        events = list(data)
+    else:
+        events = list(ListReader(data).get_series())
     total = 0
-    for (uuid, df) in reader.get_series():
-        if uuid not in series:
-            try:
-                series[uuid] = Timeseries.objects.get(uuid=uuid)
-            except Timeseries.DoesNotExist:
-                map = IdMapping.objects.get(user__username=user, remote_id=uuid)
-                series[uuid] = map.timeseries
-            locations[series[uuid].location_id] = 1
-        events.append((uuid, df))
-        if not user.has_perm(PERMISSION_CHANGE, series[uuid]):
-            permission = False
-    if not permission:
-        raise ex.PermissionDenied("Permission denied")
-    for (uuid, df) in events:
-        series[uuid].set_events(df)
-        total += len(df)
-        series[uuid].save()
-    return total, len(series), len(locations)
+    series = writable_series(user, [uuid for (uuid, df) in events])
+    for ts in series.values():
+        locations[ts.location_id] = 1
+    # Group the blocks per timeseries, which may be posted by uuid and by
+    # remote id, and may then share one instance.
+    frames = OrderedDict()
+    for (key, df) in events:
+        frames.setdefault(series[key].pk, []).append((key, df))
+
+    def write(pk):
+        # Blocks of the same series are written in turn, by one thread.
+        # Returns the number of blocks written and the exception, if any.
+        written = 0
+        try:
+            for key, df in frames[pk]:
+                series[key].set_events(df)
+                written += 1
+        except Exception as e:
+            logger.exception("Writing events of %s failed", key)
+            return written, e
+        return written, None
+
+    errors = {}
+    written_series = []
+    indexes = []
+    for pk, (written, error) in zip(frames,
+                                    parallel_map(write, frames, WRITE_THREADS)):
+        blocks = frames[pk]
+        total += sum(len(df) for key, df in blocks[:written])
+        written_series.extend(series[key] for key, df in blocks[:written])
+        if error is not None:
+            # The blocks from the failed one on weren't written.
+            for key, df in blocks[written:]:
+                errors[key] = error
+        # A failed block may be partly written, so its range is stale too.
+        indexes.extend((series[key].uuid, df.index)
+                       for key, df in blocks[:written + (error is not None)]
+                       if len(df))
+    # Save the first and latest values of all written series at once,
+    # including the blocks written before a block of the series failed.
+    metadata.save_events_metadata(written_series)
+    # Update the caches of all series at once, in a few round trips.
+    ranges = [(ts_uuid, index.min(), index.max())
+              for ts_uuid, index in indexes]
+    uuids = set(ts_uuid for ts_uuid, index in indexes)
+    conditional.touch_many(uuids)
+    eventindex.record_many(indexes)
+    pyramid.invalidate_many(ranges)
+    eventcache.invalidate_many(uuids)
+    return total, len(series), len(locations), errors
+
+
+def readable_timeseries(user):
+    """
+    Return the timeseries whose events `user` may read.
+    """
+    if not user.is_authenticated():
+        return Timeseries.objects.none()
+    elif user.is_superuser:
+        return Timeseries.objects
+    else:
+        return Timeseries.objects.filter(data_set__in=DataSet.objects.filter(permission_mappers__user_group__members=user).distinct()).distinct()
+
+
+def parse_datetime(value):
+    """
+    Parse a start or end GET parameter, with or without milliseconds.
+    """
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, COLNAME_FORMAT)
+    except ValueError:
+        # use the alternative format
+        return datetime.strptime(value, COLNAME_FORMAT_MS)
+
+
+def get_events_page(ts, start, end, page_size, **kwargs):
+    """
+    Return the first `page_size` events from `start` on, and whether there
+    are more events before `end`.
+
+    The event store can't limit a read to a number of rows, so read
+    consecutive windows that double in length until the page is full.
+    The first window is sized on the source frequency of the timeseries.
+    """
+    latest = naive_utc(ts.latest_value_timestamp)
+    if end is None or (latest is not None and latest < end):
+        end = latest
+    if start is None:
+        start = naive_utc(ts.first_value_timestamp)
+    if start is None or end is None or start > end:
+        df = ts.get_events(start=start, end=end, **kwargs)
+        return df[:page_size], len(df) > page_size
+
+    frequency = getattr(ts.source, 'frequency', None) or 60
+    window = timedelta(seconds=frequency * page_size)
+    frames = []
+    count = 0
+    while True:
+        window_end = min(start + window, end)
+        df = ts.get_events(start=start, end=window_end, **kwargs)
+        frames.append(df)
+        count += len(df)
+        if count > page_size or window_end >= end:
+            break
+        start = window_end + timedelta(microseconds=1)
+        window *= 2
+    df = pd.concat(frames) if len(frames) > 1 else frames[0]
+    return df[:page_size], count > page_size
+
+
+def encode_cursor(timestamp):
+    """Return an opaque pagination token for events after `timestamp`."""
+    value = timestamp.strftime(COLNAME_FORMAT_MS).encode('ascii')
+    return base64.urlsafe_b64encode(value).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return the timestamp encoded in a pagination token."""
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        return datetime.strptime(value.decode('ascii'), COLNAME_FORMAT_MS)
+    except (TypeError, ValueError):
+        raise ParseError("Invalid cursor.")
 
 
 def sanitize_filename(fn):
@@ -550,6 +700,15 @@ class TimeseriesDetail(APIDetailView):
                            Q(owner__data_managers=self.request.user)|Q(owner=None))
         return qs.distinct()
 
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        serializer = self.get_serializer(self.object)
+        # Hash the data, so changes of related objects change the ETag too.
+        etag = conditional.get_data_etag(request, serializer.data)
+        if conditional.is_not_modified(request, etag):
+            return conditional.not_modified_response(etag)
+        return conditional.set_validators(Response(serializer.data), etag)
+
 
 class TimeseriesBehind(TimeseriesList):
     """Return all timeseries that are late.
@@ -596,25 +755,155 @@ class BaseEventView(mixins.BaseMixin, mixins.PostListModelMixin, APIView):
 
 
 class MultiEventList(BaseEventView):
-    parser_classes = JSONParser, FormParser, CSVParser
+    parser_classes = JSONParser, FormParser, CSVParser, BinaryEventsParser
+    renderer_classes = JSONRenderer, BrowsableAPIRenderer, CSVRenderer
 
     def post(self, request, uuid=None):
         start = time.time()
-        serializer = serializers.MultiEventListSerializer(data=request.DATA)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=400)
-
-        e, t, l = write_events(getattr(request, 'user', None), serializer.data)
-        headers = self.get_success_headers(serializer.data)
+        if isinstance(request.DATA, SeriesBlocks):
+            # parsed and checked for missing fields into blocks per series
+            data = request.DATA
+            response = [{'uuid': key, 'events': len(df)}
+                        for (key, df) in data]
+        else:
+            serializer = serializers.MultiEventListSerializer(data=request.DATA)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=400)
+            data = response = serializer.data
+
+        if request.QUERY_PARAMS.get('async', None) in ('1', 'true'):
+            return self.enqueue(request, data)
+        e, t, l, errors = write_events(getattr(request, 'user', None), data)
+        headers = self.get_success_headers(response)
         elapsed = (time.time() - start) * 1000
         logger.info("POST: Wrote %d events for %d timeseries at %d locations " \
                     "in %d ms for user %s" %
                     (e, t, l, elapsed, getattr(request, 'user', None)))
-        return Response(serializer.data, status=201, headers=headers)
+        if errors and len(errors) == t:
+            # nothing was written, let the exception map choose the status
+            raise errors.values()[0]
+        if errors:
+            # some series were written, report the ones that weren't
+            return Response({
+                'events': e,
+                'errors': dict((uuid, '%s' % error)
+                               for uuid, error in errors.items()),
+            }, status=207)
+        return Response(response, status=201, headers=headers)
+
+    def enqueue(self, request, data):
+        """
+        Queue `data` to be written by the ingest workers and return 202 with
+        the url of the job.
+        """
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated():
+            raise ex.NotAuthenticated("User not logged in.")
+        if isinstance(data, SeriesBlocks):
+            keys = [key for (key, df) in data]
+            events = sum(len(df) for (key, df) in data)
+        else:
+            keys = [item['uuid'] for item in data]
+            events = sum(len(item.get('events') or []) for item in data)
+        # Report unknown timeseries and missing permissions right away.
+        writable_series(user, keys)
+        job = ingest.enqueue(user, data, len(data), events)
+        url = reverse('ingestjob-detail', args=[job['id']], request=request)
+        job['url'] = url
+        return Response(job, status=202, headers={'Location': url})
+
+    def get(self, request, uuid=None):
+        """
+        Return the events of the comma separated `uuid` timeseries at once.
+        """
+        uuids = [u for u in self.request.QUERY_PARAMS.get('uuid', '').split(',') if u]
+        if not uuids:
+            raise ParseError("Missing uuid parameter.")
+        start = parse_datetime(self.request.QUERY_PARAMS.get('start', None))
+        end = parse_datetime(self.request.QUERY_PARAMS.get('end', None))
+        filter = self.request.QUERY_PARAMS.get('filter', None)
+        eventsformat = self.request.QUERY_PARAMS.get('eventsformat', None)
+        ignore_rejected = self.request.QUERY_PARAMS.get('ignore_rejected', None)
+
+        qs = readable_timeseries(self.request.user).filter(uuid__in=uuids)
+        with metrics.timer(request, 'permissions'):
+            series = dict((ts.uuid, ts) for ts in
+                          qs.select_related('parameter', 'unit'))
+        missing = set(uuids) - set(series)
+        if missing:
+            raise Timeseries.DoesNotExist(
+                "Timeseries not found: %s" % ', '.join(sorted(missing)))
+        series = [series[u] for u in uuids]
+
+        if self.request.QUERY_PARAMS.get('format', None) == 'csv':
+            with metrics.timer(request, 'store'):
+                return self.stream_csv(series, start, end, filter,
+                                       ignore_rejected)
+        if eventsformat == 'flot':
+            with metrics.threads(request, 'store'):
+                lines = parallel_map(
+                    lambda ts: EventList.get_flot(
+                        request, ts, start, end, filter, ignore_rejected)[0],
+                    series, FETCH_THREADS)
+            return Response([{'uuid': ts.uuid, 'events': line}
+                             for ts, line in zip(series, lines)])
+
+        if eventsformat is None:
+            format_events = EventList.format_default
+        elif eventsformat == 'columns':
+            format_events = EventList.format_columns
+        elif eventsformat == 'aggregate':
+            format_events = EventList.format_aggregate
+        else:
+            raise ValueError("Invalid eventsformat: %s" % eventsformat)
+        with metrics.timer(request, 'store'):
+            frames = parallel_map(
+                lambda ts: ts.get_events(start=start, end=end, filter=filter,
+                                         ignore_rejected=ignore_rejected),
+                series, FETCH_THREADS)
+        with metrics.timer(request, 'format'):
+            response = [{'uuid': ts.uuid,
+                         'events': format_events(request, ts, df)}
+                        for ts, df in zip(series, frames)]
+        return Response(response)
+
+    @staticmethod
+    def stream_csv(series, start, end, filter=None, ignore_rejected=None):
+        """
+        Stream the values of `series` as one csv table with a column per
+        timeseries, merged on their timestamps as they are written.
+        """
+        if any(ts.is_file() for ts in series):
+            raise ValueError("File timeseries can't be exported as csv table.")
+        frames = parallel_map(
+            lambda ts: ts.get_events(start=start, end=end, filter=filter,
+                                     ignore_rejected=ignore_rejected),
+            series, FETCH_THREADS)
+        indexes = [np.asarray(df.index.values).astype(str('datetime64[ns]'))
+                   for df in frames]
+        values = [np.asarray(df['value'].values, dtype=np.float64)
+                  if len(df) else np.empty(0) for df in frames]
+        uuids = [ts.uuid for ts in series]
+
+        def rows():
+            yield '"datetime (utc)";' + \
+                ';'.join(['"%s"' % uuid for uuid in uuids]) + '\n'
+            for timestamps, columns in iter_merged(indexes, values,
+                                                   EVENTS_CHUNK_SIZE):
+                chunk = pd.DataFrame(np.column_stack(columns),
+                                     index=pd.DatetimeIndex(timestamps),
+                                     columns=uuids)
+                yield CSVRenderer.render_rows(chunk, na_rep='')
+
+        response = StreamingHttpResponse(rows(),
+                                         content_type=CSVRenderer.media_type)
+        response['Content-Disposition'] = "attachment; filename='events.csv'"
+        return response
 
 
 class EventList(BaseEventView):
-    renderer_classes = JSONRenderer, BrowsableAPIRenderer, CSVRenderer
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer, CSVRenderer,
+                        NumpyRenderer)
 
     def post(self, request, uuid=None):
         start = time.time()
@@ -633,6 +922,8 @@ class EventList(BaseEventView):
                 # use the alternative format
                 timestamp = datetime.strptime(dt, COLNAME_FORMAT_MS)
             ts.set_file(timestamp, request.FILES)
+            eventcache.invalidate(ts.uuid)
+            conditional.touch(ts.uuid)
             data = {'datetime' : dt, 'value' : reverse('event-detail',
                 args=[uuid, dt], request=request)}
             ts.save()
@@ -644,7 +935,9 @@ class EventList(BaseEventView):
             return Response(serializer.errors, status=400)
 
         data = [{"uuid": uuid, "events": serializer.data}]
-        e, t, l = write_events(getattr(request, 'user', None), data)
+        e, t, l, errors = write_events(getattr(request, 'user', None), data)
+        if errors:
+            raise errors.values()[0]
         headers = self.get_success_headers(serializer.data)
         elapsed = (time.time() - start) * 1000
         logger.info("POST: Wrote %d events for %d timeseries at %d locations " \
@@ -655,15 +948,22 @@ class EventList(BaseEventView):
 
     def get(self, request, uuid=None):
 
-        qs = Timeseries.objects
-        if not self.request.user.is_authenticated():
-            qs = Timeseries.objects.none()
-        elif self.request.user.is_superuser:
-            qs = Timeseries.objects
-        else:
-            qs = Timeseries.objects.filter(data_set__in=DataSet.objects.filter(permission_mappers__user_group__members=self.request.user).distinct()).distinct()
+        with metrics.timer(request, 'permissions'):
+            ts = readable_timeseries(self.request.user).get(uuid=uuid)
+
+        # Answer conditional requests before touching the event store.
+        # A scatter plot also depends on the other timeseries, skip those.
+        validators = None
+        if self.request.QUERY_PARAMS.get('combine_with', None) is None:
+            validators = conditional.get_validators(request, ts)
+            if conditional.is_not_modified(request, *validators):
+                return conditional.not_modified_response(*validators)
+        response = self.list_events(request, ts, uuid)
+        if validators is not None:
+            conditional.set_validators(response, *validators)
+        return response
 
-        ts = qs.get(uuid=uuid)
+    def list_events(self, request, ts, uuid):
         headers = {}
 
         # grab GET parameters
@@ -675,33 +975,78 @@ class EventList(BaseEventView):
         page_num = self.request.QUERY_PARAMS.get('page', 1)
         combine_with = self.request.QUERY_PARAMS.get('combine_with', None)
         ignore_rejected = self.request.QUERY_PARAMS.get('ignore_rejected', None)
+        cursor = self.request.QUERY_PARAMS.get('cursor', None)
 
         # parse start and end date
-        if start is not None:
-            try:
-                start = datetime.strptime(start, COLNAME_FORMAT)
-            except ValueError:
-                # use the alternative format
-                start = datetime.strptime(start, COLNAME_FORMAT_MS)
-        if end is not None:
-            try:
-                end = datetime.strptime(end, COLNAME_FORMAT)
-            except ValueError:
-                # use the alternative format
-                end = datetime.strptime(end, COLNAME_FORMAT_MS)
+        start = parse_datetime(start)
+        end = parse_datetime(end)
+
+        ps = generics.MultipleObjectAPIView(request=request)
+        page_size = ps.get_paginate_by(None)
+
+        # Serve responses that aren't streamed or binary from the cache.
+        cache_key = None
+        if (format != 'csv' and
+                request.accepted_renderer.format != NumpyRenderer.format and
+                (eventsformat is not None or cursor is not None or page_size)):
+            cache_uuids = [ts.uuid]
+            if eventsformat == 'flot' and combine_with is not None:
+                cache_uuids.append(combine_with)
+            cache_key = eventcache.get_key(cache_uuids, request)
+            response = eventcache.get(cache_key)
+            if response is not None:
+                return Response(data=response, headers=headers)
 
         if format == 'csv':
-            # in case of csv return a dataframe and let the renderer handle it
-            response = ts.get_events(start=start, end=end, filter=filter)
-            headers['Content-Disposition'] = "attachment; filename='%s-%s.csv'" \
+            # in case of csv stream the dataframe through the renderer
+            with metrics.timer(request, 'store'):
+                df = ts.get_events(start=start, end=end, filter=filter)
+            response = StreamingHttpResponse(
+                CSVRenderer().render_chunks(df, EVENTS_CHUNK_SIZE),
+                content_type=CSVRenderer.media_type)
+            response['Content-Disposition'] = "attachment; filename='%s-%s.csv'" \
+                % (uuid, sanitize_filename(ts.name))
+            return response
+        elif request.accepted_renderer.format == NumpyRenderer.format:
+            # in case of npz return a dataframe and let the renderer handle it
+            if ts.is_file():
+                raise ValueError("Cannot write file events as npz.")
+            with metrics.timer(request, 'store'):
+                response = ts.get_events(start=start, end=end, filter=filter,
+                                         ignore_rejected=ignore_rejected)
+            headers['Content-Disposition'] = "attachment; filename='%s-%s.npz'" \
                 % (uuid, sanitize_filename(ts.name))
+        elif eventsformat is None and cursor is not None:
+            # cursor pagination, only read and format the requested page
+            if cursor:
+                after = decode_cursor(cursor) + timedelta(microseconds=1)
+                start = after if start is None else max(start, after)
+            with metrics.timer(request, 'store'):
+                df, has_next = get_events_page(ts, start, end,
+                    page_size or EVENTS_CHUNK_SIZE,
+                    filter=filter, ignore_rejected=ignore_rejected)
+            next_url = None
+            if has_next:
+                next_url = replace_query_param(request.build_absolute_uri(),
+                    'cursor', encode_cursor(df.index[-1]))
+            with metrics.timer(request, 'format'):
+                response = {
+                    'next': next_url,
+                    'results': self.format_default(request, ts, df),
+                }
         elif eventsformat is None:
-            df = ts.get_events(start=start, end=end, filter=filter, ignore_rejected=ignore_rejected)
-            all = self.format_default(request, ts, df)
-            ps = generics.MultipleObjectAPIView(request=request)
-            page_size = ps.get_paginate_by(None)
+            with metrics.timer(request, 'store'):
+                df = ts.get_events(start=start, end=end, filter=filter, ignore_rejected=ignore_rejected)
             if not page_size:
-                return Response(all)
+                if request.accepted_renderer.format == 'json':
+                    return StreamingHttpResponse(
+                        self.stream_default(request, ts, df),
+                        content_type='application/json')
+                with metrics.timer(request, 'format'):
+                    response = self.format_default(request, ts, df)
+                return Response(response)
+            with metrics.timer(request, 'format'):
+                all = self.format_default(request, ts, df)
             paginator = Paginator(all, page_size)
             try:
                 page = paginator.page(page_num)
@@ -712,52 +1057,72 @@ class EventList(BaseEventView):
             context = {'request':request}
             serializer = PaginationSerializer(instance=page, context=context)
             response = serializer.data
+        elif eventsformat == 'columns':
+            with metrics.timer(request, 'store'):
+                df = ts.get_events(start=start, end=end, filter=filter, ignore_rejected=ignore_rejected)
+            with metrics.timer(request, 'format'):
+                response = self.format_columns(request, ts, df)
+        elif eventsformat == 'aggregate':
+            with metrics.timer(request, 'store'):
+                df = ts.get_events(start=start, end=end, filter=filter, ignore_rejected=ignore_rejected)
+            with metrics.timer(request, 'format'):
+                response = self.format_aggregate(request, ts, df)
         elif eventsformat == 'flot' and combine_with is not None:
-            # scatterplot, pad to hourly frequency
+            # scatterplot, read both timeseries at the same time
             other_ts = Timeseries.objects.get(uuid=combine_with)
             # returns an object ready for a jQuery scatter plot
-            df_xaxis = ts.get_events(
-                start=start,
-                end=end,
-                filter=filter,
-                ignore_rejected=ignore_rejected).asfreq('1H', method='pad')
-            df_yaxis = other_ts.get_events(
-                start=start,
-                end=end,
-                filter=filter,
-                ignore_rejected=ignore_rejected).asfreq('1H', method='pad')
-            response = self.format_flot_scatter(request, df_xaxis, df_yaxis, ts, other_ts, start, end)
+            with metrics.timer(request, 'store'):
+                df_xaxis, df_yaxis = parallel_map(
+                    lambda series: series.get_events(
+                        start=start,
+                        end=end,
+                        filter=filter,
+                        ignore_rejected=ignore_rejected),
+                    [ts, other_ts], FETCH_THREADS)
+            with metrics.timer(request, 'format'):
+                response = self.format_flot_scatter(request, df_xaxis, df_yaxis, ts, other_ts, start, end)
         elif eventsformat == 'flot':
             # only return in jQuery Flot compatible format when requested
-            timer_start = datetime.now()
-            df = ts.get_events(
-                start=start,
-                end=end,
-                filter=filter,
-                ignore_rejected=ignore_rejected)
-            timer_get_events = datetime.now() - timer_start
-            response = self.format_flot(request, ts, df, start, end, timer_get_events=timer_get_events)
-            if len(df) == 0:
-                # look at db for latest value
-                if ts.latest_value_timestamp is not None:
-                    ts_start = ts.latest_value_timestamp - (end - start)
-                else:
-                    ts_start = start
-                ts_end = ts.latest_value_timestamp
-                df = ts.get_events(
-                    start=ts_start,
-                    end=ts_end,
-                    filter=filter,
-                    ignore_rejected=ignore_rejected)
-                response = self.format_flot(request, ts, df, start, end)
+            response, latest = self.get_flot(request, ts, start, end, filter,
+                                             ignore_rejected)
+        if cache_key is not None:
+            eventcache.store(cache_key, response)
         return Response(data=response, headers=headers)
 
     @staticmethod
     def format_default(request, ts, df):
-        if (
-            ts.is_file() and ts.value_type ==
-            Timeseries.ValueType.GEO_REMOTE_SENSING
-        ):
+        if ts.is_file():
+            columns = EventList.file_event_columns(request, ts, df)
+            keys = [key for key, values in columns]
+            events = [
+                dict(zip(keys, row))
+                for row in zip(*[values for key, values in columns])
+            ]
+        else:
+            events = [
+                dict(
+                    [('datetime', timestamp.strftime(COLNAME_FORMAT_MS))] +
+                    [(colname, row[i]) for i, colname in enumerate(df.columns)]
+                ) for timestamp, row in df.iterrows()
+            ]
+        return events
+
+    @staticmethod
+    def file_event_columns(request, ts, df):
+        """
+        Return (key, values) pairs of the events of a file timeseries.
+
+        The event-detail url is resolved once, and all timestamps are
+        formatted in one pass over the index.
+        """
+        datetimes = format_datetimes(df.index)
+        # FILENAME_FORMAT is COLNAME_FORMAT_MS with dots instead of colons.
+        url_format = event_detail_url_format(request)
+        urls = [url_format.format(uuid=ts.uuid, dt=dt.replace(':', '.'))
+                for dt in datetimes]
+        columns = [('datetime', datetimes), ('value', urls)]
+
+        if ts.value_type == Timeseries.ValueType.GEO_REMOTE_SENSING:
             # GeoTIFFs are published as WMS via GeoServer. Our API cannot
             # provide clients with a GetMap request URL here, because we
             # don't have a bbox at this point. Return workspace:layer
@@ -767,36 +1132,54 @@ class EventList(BaseEventView):
             # The uuid not remote_id is used, because the latter
             # is not guaranteed to be unique across suppliers.
 
-            layer = "{workspace}:{layer}_{{}}".format(
+            layer = "{workspace}:{layer}_".format(
                 workspace="ddsc", layer=ts.uuid)
+            # GEOSERVER_FORMAT has whole seconds.
+            columns.append(('layer', format_datetimes(
+                df.index, unit='s', prefix=layer)))
+        return columns
 
-            events = [
-                dict([
-                    ('datetime', timestamp.strftime(COLNAME_FORMAT_MS)),
-                    ('value', reverse('event-detail', args=[
-                        ts.uuid, timestamp.strftime(FILENAME_FORMAT)],
-                        request=request)),
-                    ('layer', layer.format(
-                        timestamp.strftime(GEOSERVER_FORMAT)))
-                ]) for timestamp, row in df.iterrows()
-            ]
-        elif ts.is_file():
-            events = [
-                dict([
-                    ('datetime', timestamp.strftime(COLNAME_FORMAT_MS)),
-                    ('value', reverse('event-detail', args=[
-                        ts.uuid, timestamp.strftime(FILENAME_FORMAT)],
-                        request=request))
-                ]) for timestamp, row in df.iterrows()
-            ]
-        else:
-            events = [
-                dict(
-                    [('datetime', timestamp.strftime(COLNAME_FORMAT_MS))] +
-                    [(colname, row[i]) for i, colname in enumerate(df.columns)]
-                ) for timestamp, row in df.iterrows()
-            ]
-        return events
+    @staticmethod
+    def stream_default(request, ts, df):
+        """
+        Yield the default events format as JSON, a block of rows at a time.
+        """
+        return iter_json_list(
+            EventList.format_default(request, ts, chunk)
+            for chunk in iter_chunks(df, EVENTS_CHUNK_SIZE))
+
+    @staticmethod
+    def format_columns(request, ts, df):
+        """
+        Return events as one list per column instead of one dict per event.
+        """
+        if ts.is_file():
+            return dict(EventList.file_event_columns(request, ts, df))
+        columns = {'datetime': format_datetimes(df.index)}
+        for colname in df.columns:
+            columns[colname] = df[colname].values.tolist()
+        return columns
+
+    @staticmethod
+    def format_aggregate(request, ts, df):
+        """
+        Return min, max, mean and/or count of the events per interval.
+        """
+        interval = request.QUERY_PARAMS.get('interval', '1H')
+        agg = request.QUERY_PARAMS.get('agg', ','.join(aggregation.AGGREGATES))
+        if ts.is_file():
+            raise ValueError("Cannot aggregate events of a file timeseries.")
+        aggregates = aggregation.parse_aggregates(agg)
+        result = aggregation.aggregate(
+            epoch_ms(df.index), df['value'].values,
+            aggregation.parse_interval(interval), aggregates)
+        columns = {
+            'interval': interval,
+            'datetime': format_datetimes(result['datetime']),
+        }
+        for name in aggregates:
+            columns[name] = result[name].tolist()
+        return columns
 
     @staticmethod
     def format_flot_scatter(request, df_xaxis, df_yaxis, ts, other_ts, start, end):
@@ -805,10 +1188,23 @@ class EventList(BaseEventView):
         df_xaxis = df_xaxis.dropna(subset=["value"])
         df_yaxis = df_yaxis.dropna(subset=["value"])
 
-        if len(df_xaxis) > 0 and len(df_yaxis) > 0:
-            data = zip(df_xaxis['value'].values, df_yaxis['value'].values)
-        else:
-            data = []
+        # Pair each x event with the nearest y event within the tolerance.
+        tolerance = aggregation.parse_interval(
+            request.QUERY_PARAMS.get('align_tolerance', '1H'))
+        x, y = align_nearest(
+            epoch_ms(df_xaxis.index), df_xaxis['value'].values,
+            epoch_ms(df_yaxis.index), df_yaxis['value'].values, tolerance)
+
+        # Reduce to one pair per pixel (or grid cell) if there are many.
+        if len(x) > MAX_VALUES:
+            try:
+                columns = int(float(request.QUERY_PARAMS.get('width')))
+                rows = int(float(request.QUERY_PARAMS.get('height')))
+            except (TypeError, ValueError):
+                columns = rows = SCATTER_GRID_SIZE
+            if columns > 0 and rows > 0:
+                x, y = grid_reduce(x, y, columns, rows)
+        data = zip(x.tolist(), y.tolist())
         line = {
             'label': '{} vs. {}'.format(ts, other_ts),
             'data': data,
@@ -833,14 +1229,60 @@ class EventList(BaseEventView):
         return line
 
     @staticmethod
-    def format_flot(request, ts, df, start=None, end=None, timer_get_events=None):
+    def get_flot(request, ts, start, end, filter=None, ignore_rejected=None):
+        """
+        Return a flot line of the events of `ts` between `start` and `end`,
+        and whether it shows the latest events instead, because the window
+        is empty.
+        """
+        level = None
+        width = request.QUERY_PARAMS.get('width', None)
+        if filter is None and start is not None and end is not None and width:
+            try:
+                level = pyramid.select_level(
+                    (to_ms(end) - to_ms(start)) / float(width))
+            except (ValueError, ZeroDivisionError):
+                pass
+        if eventindex.window_is_empty(ts, start, end):
+            # no need to ask the event store
+            df = pd.DataFrame({'value': []})
+        elif level is not None:
+            # use pre-decimated events, identical at this graph width
+            with metrics.timer(request, 'store'):
+                df = pyramid.get_events(ts, start, end, level,
+                    ignore_rejected=ignore_rejected)
+        else:
+            with metrics.timer(request, 'store'):
+                df = ts.get_events(
+                    start=start,
+                    end=end,
+                    filter=filter,
+                    ignore_rejected=ignore_rejected)
+        line = EventList.format_flot(request, ts, df, start, end)
+        if (len(df) > 0 or start is None or end is None or
+                ts.latest_value_timestamp is None):
+            return line, False
+        # look at db for latest value
+        ts_start, ts_end = eventindex.fallback_window(ts, start, end)
+        with metrics.timer(request, 'store'):
+            df = ts.get_events(
+                start=ts_start,
+                end=ts_end,
+                filter=filter,
+                ignore_rejected=ignore_rejected)
+        return EventList.format_flot(request, ts, df, ts_start, ts_end), True
+
+    @staticmethod
+    def format_flot(request, ts, df, start=None, end=None):
         tolerance = request.QUERY_PARAMS.get('tolerance', None)
         width = request.QUERY_PARAMS.get('width', None)
         height = request.QUERY_PARAMS.get('height', None)
+        downsample = request.QUERY_PARAMS.get('downsample', 'rdp')
+        if downsample not in DOWNSAMPLERS:
+            raise ValueError("Invalid downsample: %s" % downsample)
 
-        timer_to_js_timestamps = None
-        timer_douglas_peucker = None
-        timer_zip = None
+        tolerance_w = None
+        tolerance_h = None
 
         # Drop NaN values. (Recent pandas versions support inplace drop.)
         df = df.dropna(subset=["value"])
@@ -855,19 +1297,40 @@ class EventList(BaseEventView):
             # Add values to the response.
             # Convert event dates to timestamps with milliseconds since epoch.
             # TODO see if source timezone / display timezone are relevant
-            timer_start = datetime.now()
-            timestamps = [to_js_timestamp(dt) for dt in df.index]
+            with metrics.timer(request, 'format'):
+                timestamps = [to_js_timestamp(dt) for dt in df.index]
 
-            # Decimate only operates on Numpy arrays, so convert our timestamps
-            # back to one.
-            timestamps = np.array(timestamps)
-            timer_to_js_timestamps = datetime.now() - timer_start
+                # Decimate only operates on Numpy arrays, so convert our
+                # timestamps back to one.
+                timestamps = np.array(timestamps)
             values = df['value'].values
 
-            # Decimate values (a.k.a. line simplification), using Ramer-Douglas-Peucker.
+            # Decimate values (a.k.a. line simplification), using Ramer-Douglas-Peucker
+            # by default, or one of the linear time downsamplers when requested.
             # Determine tolerance using either the provided value,
             # or calculate it using width and height of the graph.
-            if tolerance is not None:
+            if downsample != 'rdp':
+                try:
+                    pixels = int(float(width))
+                except (TypeError, ValueError):
+                    pixels = None
+                if downsample == 'm4':
+                    if start and end:
+                        # use min and max of the actual requested graph range,
+                        # widened to events outside of it
+                        x_range = (min(to_js_timestamp(start), timestamps[0]),
+                                   max(to_js_timestamp(end), timestamps[-1]))
+                    else:
+                        x_range = None, None
+                    with metrics.timer(request, 'decimate'):
+                        timestamps, values = m4(timestamps, values,
+                            pixels or MAX_VALUES // 4, *x_range)
+                else:
+                    with metrics.timer(request, 'decimate'):
+                        timestamps, values = lttb(timestamps, values,
+                            pixels or MAX_VALUES)
+                tolerance = None
+            elif tolerance is not None:
                 try:
                     tolerance = float(tolerance)
                 except ValueError:
@@ -875,9 +1338,6 @@ class EventList(BaseEventView):
             elif width is not None and height is not None:
                 # Assume graph scales with min and max of the entire range here.
                 # Otherwise we need to pass axes min/max as well.
-
-                # Disable horizontal tolerance for now.
-                '''
                 try:
                     width = float(width)
                     if start and end:
@@ -890,31 +1350,36 @@ class EventList(BaseEventView):
                     # Timestamps are sorted, so we can just do this.
                     tolerance_w_possible = (timestamps[-1] - timestamps[0]) / width
                     tolerance_w = max(tolerance_w_requested, tolerance_w_possible)
-                except ValueError:
+                except (ValueError, ZeroDivisionError):
                     tolerance_w = None
-                '''
 
                 try:
                     height = float(height)
                     tolerance_h = (values.max() - values.min()) / height
-                except ValueError:
+                except (ValueError, ZeroDivisionError):
                     tolerance_h = None
 
-                # Just use vertical tolerance for now, until we have a better 2D solution.
+                # Fall back to vertical tolerance only for an invalid width.
                 tolerance = tolerance_h
 
             # Apply the actual line simplification.
             # Only possible on 2 or more values.
-            if tolerance is not None and len(df) > 1:
+            if tolerance_w is not None and tolerance_h is not None and len(df) > 1:
+                # Simplify in pixels, keeping at most 4 points per pixel column.
+                before = len(values)
+                with metrics.timer(request, 'decimate'):
+                    timestamps, values = decimate_2d(timestamps, values,
+                        tolerance_w, tolerance_h, max_values=int(4 * width))
+                logger.debug('decimate_2d: %s values left of %s, with tol = %s, %s',
+                             len(values), before, tolerance_w, tolerance_h)
+            elif tolerance is not None and len(df) > 1:
                 before = len(values)
-                timer_start = datetime.now()
-                timestamps, values = decimate_until(timestamps, values, tolerance)
-                timer_douglas_peucker = datetime.now() - timer_start
+                with metrics.timer(request, 'decimate'):
+                    timestamps, values = decimate_until(timestamps, values, tolerance)
                 logger.debug('decimate: %s values left of %s, with tol = %s', len(values), before, tolerance)
 
-            timer_start = datetime.now()
-            data = zip(timestamps, values)
-            timer_zip = datetime.now() - timer_start
+            with metrics.timer(request, 'format'):
+                data = zip(timestamps, values)
             xmin = timestamps[-1] # timestamps is sorted
             xmax = timestamps[0]  # timestamps is sorted
         else:
@@ -934,10 +1399,6 @@ class EventList(BaseEventView):
             # line is plotted.
             'xmin': xmin,
             'xmax': xmax,
-            'timer_get_events': str(timer_get_events),
-            'timer_to_js_timestamps': str(timer_to_js_timestamps),
-            'timer_douglas_peucker': str(timer_douglas_peucker),
-            'timer_zip': str(timer_zip),
         }
 
         return line
@@ -1451,3 +1912,28 @@ class Summary(APIReadOnlyListView):
         }
         return Response(data=data)
 
+
+
+class Metrics(mixins.BaseMixin, APIView):
+    """
+    Return the stage timing histograms of this process, for superusers.
+    """
+
+    def get(self, request):
+        if not request.user.is_superuser:
+            raise ex.PermissionDenied('Only superusers can view metrics')
+        return Response(data=metrics.snapshot())
+
+
+class IngestJobDetail(mixins.BaseMixin, APIView):
+    """
+    Return the status of an event batch posted with ?async=1.
+    """
+
+    def get(self, request, pk=None):
+        job = ingest.get_job(pk)
+        if job is None or not (request.user.is_superuser or
+                               job['user_id'] == request.user.pk):
+            raise Http404
+        job['url'] = reverse('ingestjob-detail', args=[pk], request=request)
+        return Response(data=job)